@@ -1,20 +1,734 @@
-from flask import Flask, request, Response
+from flask import Flask, request, Response, send_file, g, has_request_context
+from flask.wrappers import Request
+import click
 import os
-import requests
 import time
 import json
 import random
+import hashlib
+import hmac
+import gzip
+import csv
+import math
+import sys
+import importlib
+import importlib.util
+import re
+import select
+import urllib.parse
+import uuid
+from datetime import datetime
+import threading
+import shutil
+import tempfile
+from io import BytesIO
+from contextlib import contextmanager, nullcontext
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported on first attribute access.
+
+    requests / gspread / google-auth / psycopg2 / Pillow together take a large share of
+    import time; most worker boots and many routes (/, /generate-otp, ...) never need
+    them, so they're loaded when first used instead of at `import app`.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+requests = LazyModule("requests")
+gspread = LazyModule("gspread")
+google_service_account = LazyModule("google.oauth2.service_account")
 
-import gspread
-from google.oauth2.service_account import Credentials
+psycopg2 = LazyModule("psycopg2")  # RealDictCursor venam, comment/delete
+psycopg2_pool = LazyModule("psycopg2.pool")
+psycopg2_extras = LazyModule("psycopg2.extras")
 
-import psycopg2  # RealDictCursor venam, comment/delete
+
+def execute_values(*args, **kwargs):
+    return psycopg2_extras.execute_values(*args, **kwargs)
+
+
+# optional – only needed for thumbnails / WebP variants
+Image = LazyModule("PIL.Image") if importlib.util.find_spec("PIL") is not None else None
+# optional – vectorized /quote distances (pure-Python math otherwise)
+numpy = LazyModule("numpy") if importlib.util.find_spec("numpy") is not None else None
 
 app = Flask(__name__)
 OTP_TTL_SECONDS = 5 * 60  # 5 minutes
 
 # In-memory store: { email_lower: { "otp": "123456", "expires_at": 1234567890 } }
 otp_store = {}
+# Guards otp_store – requests run on several threads per worker (gthread / gevent).
+_otp_lock = threading.RLock()
+
+
+# ===================== METRICS (Prometheus) =====================
+
+# prometheus_client is optional and loaded on first use (warm-up / first request).
+# Under gunicorn with several workers, set PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py
+# does) so /metrics aggregates all workers instead of whichever one answered.
+METRICS_ENABLED = (
+    os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+    and importlib.util.find_spec("prometheus_client") is not None
+)
+prometheus_client = LazyModule("prometheus_client")
+
+# seconds – spans fast cache hits up to the 30 s Gemini timeout
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+class Metrics:
+    def __init__(self):
+        pc = prometheus_client
+        self.multiprocess = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+        gauge_kw = {"multiprocess_mode": "livesum"} if self.multiprocess else {}
+
+        self.requests = pc.Counter(
+            "tripplanner_http_requests_total", "HTTP requests by route and status.",
+            ["route", "method", "status"],
+        )
+        self.request_latency = pc.Histogram(
+            "tripplanner_http_request_duration_seconds", "HTTP request latency by route.",
+            ["route", "method"], buckets=LATENCY_BUCKETS,
+        )
+        self.in_flight = pc.Gauge(
+            "tripplanner_http_requests_in_flight", "HTTP requests currently being served.",
+            ["route"], **gauge_kw,
+        )
+        self.upstream_latency = pc.Histogram(
+            "tripplanner_upstream_duration_seconds", "Latency of calls to Gemini / Sheets / Postgres.",
+            ["upstream", "operation", "outcome"], buckets=LATENCY_BUCKETS,
+        )
+        self.upstream_in_flight = pc.Gauge(
+            "tripplanner_upstream_in_flight", "Upstream calls currently waiting.",
+            ["upstream"], **gauge_kw,
+        )
+
+        self.bulkhead_limit = pc.Gauge(
+            "tripplanner_bulkhead_limit", "Concurrent calls allowed per dependency.",
+            ["dependency"], **({"multiprocess_mode": "livemax"} if self.multiprocess else {}),
+        )
+        self.bulkhead_active = pc.Gauge(
+            "tripplanner_bulkhead_active", "Calls currently holding a bulkhead slot.",
+            ["dependency"], **gauge_kw,
+        )
+        self.bulkhead_waiting = pc.Gauge(
+            "tripplanner_bulkhead_waiting", "Calls queued for a bulkhead slot.",
+            ["dependency"], **gauge_kw,
+        )
+        self.bulkhead_wait = pc.Histogram(
+            "tripplanner_bulkhead_wait_seconds", "Time spent queued for a bulkhead slot.",
+            ["dependency"], buckets=LATENCY_BUCKETS,
+        )
+        self.bulkhead_rejected = pc.Counter(
+            "tripplanner_bulkhead_rejected_total", "Calls rejected by a bulkhead (queue full or wait too long).",
+            ["dependency", "reason"],
+        )
+
+    def registry(self):
+        if self.multiprocess:
+            registry = prometheus_client.CollectorRegistry()
+            prometheus_client.multiprocess.MultiProcessCollector(registry)
+            return registry
+        return prometheus_client.REGISTRY
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """The worker's Metrics (created on first use), or None when metrics are off."""
+    global _metrics
+    if _metrics is None and METRICS_ENABLED:
+        with _metrics_lock:
+            if _metrics is None:
+                importlib.import_module("prometheus_client.multiprocess")
+                _metrics = Metrics()
+    return _metrics
+
+
+@contextmanager
+def observe_upstream(upstream: str, operation: str, admit: bool = True):
+    """
+    Time one upstream call:
+
+        with observe_upstream("sheets", "get_all_values") as span:
+            ...
+            span["outcome"] = "error"   # optional, for failures that don't raise
+
+    Exceptions are recorded as outcome="error" and re-raised. The time also counts
+    towards the request's "upstream" phase (see PROFILING below).
+    With `admit`, the call first takes a slot in the upstream's bulkhead (see
+    BULKHEADS below) and raises BulkheadRejected if it can't get one in time.
+    """
+    bulkhead = get_bulkhead(upstream) if admit else None
+    if bulkhead is not None:
+        with bulkhead:
+            with observe_upstream(upstream, operation, admit=False) as span:
+                yield span
+        return
+
+    span = {"outcome": "ok"}
+    m = get_metrics()
+    gauge = m.upstream_in_flight.labels(upstream) if m is not None else None
+    if gauge is not None:
+        gauge.inc()
+    start = time.perf_counter()
+    try:
+        yield span
+    except BaseException:
+        span["outcome"] = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        profiler.record_phase("upstream", elapsed, upstream)
+        if m is not None:
+            m.upstream_latency.labels(upstream, operation, span["outcome"]).observe(elapsed)
+            gauge.dec()
+
+
+_SQL_TABLE_RE = re.compile(
+    r"\b(?:copy|from|into|update|table|on)\s+(?:if\s+(?:not\s+)?exists\s+)?([a-z_][a-z0-9_]*)",
+    re.IGNORECASE,
+)
+
+
+def _sql_operation(sql) -> str:
+    """Low-cardinality label for a statement: "<verb> <first table>", e.g. "select image_blobs"."""
+    if isinstance(sql, bytes):
+        sql = sql[:300].decode("utf-8", "ignore")
+    head = sql[:300].strip()
+    verb = head.split(None, 1)[0].lower() if head else "unknown"
+    m = _SQL_TABLE_RE.search(head)
+    return f"{verb} {m.group(1).lower()}" if m else verb
+
+
+@app.before_request
+def _metrics_before_request():
+    m = get_metrics()
+    if m is None:
+        return
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    g._metrics_route = route
+    g._metrics_start = time.perf_counter()
+    m.in_flight.labels(route).inc()
+
+
+@app.after_request
+def _metrics_after_request(resp):
+    m = get_metrics()
+    start = g.get("_metrics_start")
+    if m is not None and start is not None:
+        route = g._metrics_route
+        m.requests.labels(route, request.method, str(resp.status_code)).inc()
+        m.request_latency.labels(route, request.method).observe(time.perf_counter() - start)
+        g._metrics_recorded = True
+    return resp
+
+
+@app.teardown_request
+def _metrics_teardown_request(exc):
+    m = get_metrics()
+    start = g.get("_metrics_start")
+    if m is None or start is None:
+        return
+    route = g._metrics_route
+    if not g.get("_metrics_recorded"):
+        # unhandled exception → after_request never ran
+        m.requests.labels(route, request.method, "500").inc()
+        m.request_latency.labels(route, request.method).observe(time.perf_counter() - start)
+    m.in_flight.labels(route).dec()
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_route():
+    m = get_metrics()
+    if m is None:
+        return Response("metrics disabled (prometheus_client not installed or METRICS_ENABLED=0)\n",
+                        status=503, mimetype="text/plain")
+    return Response(prometheus_client.generate_latest(m.registry()), mimetype=prometheus_client.CONTENT_TYPE_LATEST)
+
+
+# ===================== PROFILING (sampling profiler + slow-request capture) =====================
+
+# One background thread per worker samples Python stacks with sys._current_frames():
+#   - on demand: every thread for N seconds (POST /admin/profile/start?seconds=N)
+#   - always (unless SLOW_REQUEST_MS=0): threads serving a request that has been running
+#     for a quarter of the threshold; requests that end up slower than SLOW_REQUEST_MS
+#     keep their stacks plus a parse / upstream / serialize time breakdown.
+# Captures live in the worker that took them and download as collapsed stacks
+# (flamegraph.pl, speedscope, inferno). Stacks are per OS thread, so they are only
+# meaningful with the gthread / sync workers, not gevent.
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", 10)) / 1000
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 8000))
+PROFILE_MAX_CAPTURES = int(os.environ.get("PROFILE_MAX_CAPTURES", 50))
+PROFILE_MAX_SECONDS = 300
+PROFILE_MAX_DEPTH = 100
+
+
+def _collapse_stack(frame) -> str:
+    """Outermost-first "module.function;module.function;..." for one thread."""
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        names.append(f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Profiler:
+    def __init__(self):
+        self._active = {}      # thread ident -> record of the request it is serving
+        self._session = None   # on-demand capture in progress
+        self._thread = None
+        self._lock = threading.Lock()
+        self._seq = 0
+        self.captures = OrderedDict()  # capture id -> capture, oldest first
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                    self._thread.start()
+
+    # ---- per request ----
+
+    def begin_request(self, method: str, route: str, path: str):
+        if SLOW_REQUEST_MS <= 0:
+            return
+        self._ensure_thread()
+        self._active[threading.get_ident()] = {
+            "method": method,
+            "route": route,
+            "path": path,
+            "start": time.perf_counter(),
+            "started_at": time.time(),
+            "status": None,
+            "phases": defaultdict(float),
+            "stacks": Counter(),
+        }
+
+    def note_status(self, status: int):
+        rec = self._active.get(threading.get_ident())
+        if rec is not None:
+            rec["status"] = status
+
+    def record_phase(self, phase: str, seconds: float, detail: str = None):
+        """Add time to a phase of the request running on this thread (no-op elsewhere)."""
+        rec = self._active.get(threading.get_ident())
+        if rec is not None:
+            rec["phases"][phase] += seconds
+            if detail:
+                rec["phases"][f"{phase}.{detail}"] += seconds
+
+    def end_request(self):
+        rec = self._active.pop(threading.get_ident(), None)
+        if rec is None:
+            return
+        total = time.perf_counter() - rec["start"]
+        if total * 1000 < SLOW_REQUEST_MS:
+            return
+        phases = rec["phases"]
+        known = phases["parse"] + phases["upstream"] + phases["serialize"]
+        root = f"{rec['method']} {rec['route']}"
+        stacks = list(rec["stacks"].items())  # the sampler may still be adding to it
+        self._store("slow", {
+            "started_at": rec["started_at"],
+            "duration_ms": round(total * 1000, 1),
+            "method": rec["method"],
+            "route": rec["route"],
+            "path": rec["path"],
+            "status": rec["status"] or 500,
+            "phases_ms": {
+                "parse": round(phases["parse"] * 1000, 1),
+                "upstream": round(phases["upstream"] * 1000, 1),
+                "serialize": round(phases["serialize"] * 1000, 1),
+                "other": round(max(0.0, total - known) * 1000, 1),
+                **{k: round(v * 1000, 1) for k, v in phases.items() if k.startswith("upstream.")},
+            },
+            "samples": sum(n for _, n in stacks),
+            "stacks": Counter({f"{root};{stack}": n for stack, n in stacks}),
+        })
+
+    # ---- on demand ----
+
+    def start_session(self, seconds: float):
+        """Sample every thread for `seconds`; returns the capture id, or None if one is running."""
+        with self._lock:
+            if self._session is not None:
+                return None
+            self._seq += 1
+            self._session = {
+                "id": f"profile-{os.getpid()}-{self._seq}",
+                "started_at": time.time(),
+                "deadline": time.perf_counter() + seconds,
+                "samples": 0,
+                "stacks": Counter(),
+            }
+            capture_id = self._session["id"]
+        self._ensure_thread()
+        return capture_id
+
+    def _finish_session(self, session):
+        self._session = None
+        self._store("profile", {
+            "started_at": session["started_at"],
+            "duration_ms": round((time.time() - session["started_at"]) * 1000, 1),
+            "samples": session["samples"],
+            "stacks": session["stacks"],
+        }, capture_id=session["id"])
+
+    def _store(self, kind: str, capture: dict, capture_id: str = None):
+        with self._lock:
+            if capture_id is None:
+                self._seq += 1
+                capture_id = f"{kind}-{os.getpid()}-{self._seq}"
+            self.captures[capture_id] = dict(capture, id=capture_id, kind=kind, pid=os.getpid())
+            while len(self.captures) > PROFILE_MAX_CAPTURES:
+                self.captures.popitem(last=False)
+
+    # ---- sampler thread ----
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(PROFILE_SAMPLE_INTERVAL)
+            now = time.perf_counter()
+            session = self._session
+            min_age = SLOW_REQUEST_MS / 4000
+            watched = [(ident, rec) for ident, rec in list(self._active.items()) if now - rec["start"] >= min_age]
+            if session is None and not watched:
+                continue
+
+            frames = sys._current_frames()
+            for ident, rec in watched:
+                frame = frames.get(ident)
+                if frame is not None:
+                    rec["stacks"][_collapse_stack(frame)] += 1
+
+            if session is not None:
+                if now >= session["deadline"]:
+                    self._finish_session(session)
+                    continue
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in frames.items():
+                    if ident == me:
+                        continue
+                    rec = self._active.get(ident)
+                    root = names.get(ident, "thread") + (f";{rec['method']} {rec['route']}" if rec else "")
+                    session["stacks"][f"{root};{_collapse_stack(frame)}"] += 1
+                session["samples"] += 1
+
+    def summaries(self):
+        with self._lock:
+            captures = list(self.captures.values())
+        running = self._session
+        return {
+            "pid": os.getpid(),
+            "slow_request_ms": SLOW_REQUEST_MS,
+            "running": running["id"] if running else None,
+            "captures": [{k: v for k, v in c.items() if k != "stacks"} for c in reversed(captures)],
+        }
+
+
+profiler = Profiler()
+
+
+@app.before_request
+def _profile_before_request():
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    profiler.begin_request(request.method, route, request.path)
+
+
+@app.after_request
+def _profile_after_request(resp):
+    profiler.note_status(resp.status_code)
+    return resp
+
+
+@app.teardown_request
+def _profile_teardown_request(exc):
+    profiler.end_request()
+
+
+@app.route("/admin/profile/start", methods=["POST"])
+def profile_start_route():
+    """Admin: sample every thread of this worker for ?seconds=N (default 30)."""
+    if not _admin_authorized():
+        return json_response({"status": "error", "message": "Forbidden"}, status=403)
+    seconds = min(max(parse_int_param(request.args.get("seconds"), 30), 1), PROFILE_MAX_SECONDS)
+    capture_id = profiler.start_session(seconds)
+    if capture_id is None:
+        return json_response({"status": "error", "message": "A profile is already running"}, status=409)
+    return json_response(
+        {"status": "started", "id": capture_id, "seconds": seconds, "pid": os.getpid(),
+         "url": f"/admin/profile/captures/{capture_id}"},
+        status=202,
+    )
+
+
+@app.route("/admin/profile/captures", methods=["GET"])
+def profile_captures_route():
+    """Admin: this worker's captures (newest first), without the stacks."""
+    if not _admin_authorized():
+        return json_response({"status": "error", "message": "Forbidden"}, status=403)
+    return json_response(profiler.summaries())
+
+
+@app.route("/admin/profile/captures/<capture_id>", methods=["GET"])
+def profile_capture_route(capture_id):
+    """
+    Admin: one capture as collapsed stacks ("frame;frame;frame count" per line),
+    ready for flamegraph.pl / speedscope. ?format=json gives the metadata,
+    phase breakdown and the 20 heaviest stacks instead.
+    """
+    if not _admin_authorized():
+        return json_response({"status": "error", "message": "Forbidden"}, status=403)
+    running = profiler._session
+    if running is not None and running["id"] == capture_id:
+        return json_response({"status": "running", "id": capture_id}, status=202)
+    capture = profiler.captures.get(capture_id)
+    if capture is None:
+        return json_response({"status": "error", "message": "Unknown capture (captures are per worker)"},
+                             status=404)
+
+    if request.args.get("format") == "json":
+        body = {k: v for k, v in capture.items() if k != "stacks"}
+        body["top_stacks"] = [{"stack": s, "samples": n} for s, n in capture["stacks"].most_common(20)]
+        return json_response(body)
+
+    text = "".join(f"{stack} {n}\n" for stack, n in sorted(capture["stacks"].items()))
+    resp = Response(text, mimetype="text/plain")
+    resp.headers["Content-Disposition"] = f'attachment; filename="{capture_id}.folded"'
+    return resp
+
+
+# ===================== BULKHEADS (per-dependency admission control) =====================
+
+# Gemini, Sheets and Postgres each get their own concurrency limit and a short,
+# bounded queue, so a stall in one of them can only tie up its own share of the
+# request threads. Calls that can't get a slot in time raise BulkheadRejected, and
+# the request is answered with 503 + Retry-After instead of piling up.
+#
+#   BULKHEAD_<NAME>_LIMIT         concurrent calls per worker
+#   BULKHEAD_<NAME>_QUEUE         callers allowed to wait for a slot
+#   BULKHEAD_<NAME>_MAX_WAIT_MS   how long a caller waits before giving up
+#
+# GET/POST /admin/bulkheads reads / adjusts them at runtime (for the answering worker).
+BULKHEADS_ENABLED = os.environ.get("BULKHEADS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+_BULKHEAD_DEFAULTS = {
+    # name: (limit, queue, max_wait_ms)
+    "gemini": (8, 16, 5000),
+    "sheets": (4, 16, 10000),
+    # None → DB_POOL_MAX: never more than the pool can hand out (getconn raises when empty)
+    "postgres": (None, 32, 2000),
+}
+
+
+class BulkheadRejected(Exception):
+    def __init__(self, name: str, reason: str, retry_after: int):
+        super().__init__(f"{name} is overloaded ({reason}), retry in {retry_after}s")
+        self.name = name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Bulkhead:
+    """
+    At most `limit` concurrent holders; up to `queue` more wait at most `max_wait`
+    seconds for a slot. Use as a context manager around the dependency call.
+    """
+
+    def __init__(self, name: str, limit: int, queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+        self._report_limit()
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, int(round(self.max_wait)))
+
+    def _report_limit(self):
+        m = get_metrics()
+        if m is not None:
+            m.bulkhead_limit.labels(self.name).set(self.limit)
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        m = get_metrics()
+        if m is not None:
+            m.bulkhead_rejected.labels(self.name, reason).inc()
+        exc = BulkheadRejected(self.name, reason, self.retry_after)
+        if has_request_context():
+            g._bulkhead_rejected = exc  # turned into 503 + Retry-After in after_request
+        raise exc
+
+    def acquire(self):
+        m = get_metrics()
+        with self._cond:
+            if self.active >= self.limit:
+                if self.waiting >= self.queue:
+                    self._reject("queue_full")
+                start = time.perf_counter()
+                deadline = start + self.max_wait
+                self.waiting += 1
+                if m is not None:
+                    m.bulkhead_waiting.labels(self.name).inc()
+                try:
+                    while self.active >= self.limit:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            self._reject("timeout")
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                    waited = time.perf_counter() - start
+                    if m is not None:
+                        m.bulkhead_waiting.labels(self.name).dec()
+                        m.bulkhead_wait.labels(self.name).observe(waited)
+                    profiler.record_phase("queue", waited, self.name)
+            self.active += 1
+            self.admitted += 1
+        if m is not None:
+            m.bulkhead_active.labels(self.name).inc()
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+        m = get_metrics()
+        if m is not None:
+            m.bulkhead_active.labels(self.name).dec()
+
+    def configure(self, limit: int = None, queue: int = None, max_wait: float = None):
+        with self._cond:
+            if limit is not None:
+                self.limit = max(1, limit)
+            if queue is not None:
+                self.queue = max(0, queue)
+            if max_wait is not None:
+                self.max_wait = max(0.0, max_wait)
+            self._cond.notify_all()  # a higher limit lets waiters in right away
+        self._report_limit()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "max_wait_ms": int(self.max_wait * 1000),
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+bulkheads = {}
+_bulkheads_lock = threading.Lock()
+
+
+def get_bulkhead(name: str):
+    """The worker's bulkhead for a dependency (created on first use), or None when disabled."""
+    if not BULKHEADS_ENABLED or name not in _BULKHEAD_DEFAULTS:
+        return None
+    bulkhead = bulkheads.get(name)
+    if bulkhead is None:
+        with _bulkheads_lock:
+            bulkhead = bulkheads.get(name)
+            if bulkhead is None:
+                limit, queue, max_wait_ms = _BULKHEAD_DEFAULTS[name]
+                limit = DB_POOL_MAX if limit is None else limit
+                env = f"BULKHEAD_{name.upper()}_"
+                bulkhead = Bulkhead(
+                    name,
+                    limit=int(os.environ.get(env + "LIMIT", limit)),
+                    queue=int(os.environ.get(env + "QUEUE", queue)),
+                    max_wait=float(os.environ.get(env + "MAX_WAIT_MS", max_wait_ms)) / 1000,
+                )
+                bulkheads[name] = bulkhead
+    return bulkhead
+
+
+@app.after_request
+def _bulkhead_after_request(resp):
+    # Routes catch upstream exceptions and answer 500 with their own body; when the
+    # cause was a rejected bulkhead, tell the client it's temporary and when to retry.
+    exc = g.get("_bulkhead_rejected")
+    if exc is not None and resp.status_code >= 500:
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(exc.retry_after)
+    return resp
+
+
+@app.errorhandler(BulkheadRejected)
+def _bulkhead_rejected(exc):
+    resp = Response(f"Service busy: {exc}\n", status=503, mimetype="text/plain")
+    resp.headers["Retry-After"] = str(exc.retry_after)
+    return resp
+
+
+@app.route("/admin/bulkheads", methods=["GET", "POST"])
+def bulkheads_route():
+    """
+    Admin: this worker's bulkheads. POST adjusts them, e.g.
+      {"sheets": {"limit": 2, "queue": 4, "max_wait_ms": 3000}}
+    """
+    if not _admin_authorized():
+        return json_response({"status": "error", "message": "Forbidden"}, status=403)
+    if not BULKHEADS_ENABLED:
+        return json_response({"status": "error", "message": "Bulkheads disabled (BULKHEADS_ENABLED=0)"}, status=409)
+
+    if request.method == "POST":
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not data or any(
+            name not in _BULKHEAD_DEFAULTS or not isinstance(cfg, dict) for name, cfg in data.items()
+        ):
+            return json_response(
+                {"status": "error", "message": f"Expected {{name: {{limit, queue, max_wait_ms}}}} for {sorted(_BULKHEAD_DEFAULTS)}"},
+                status=400,
+            )
+        for name, cfg in data.items():
+            limit = parse_int_param(cfg.get("limit"), None)
+            if name == "postgres" and limit is not None:
+                limit = min(limit, DB_POOL_MAX)
+            max_wait_ms = parse_int_param(cfg.get("max_wait_ms"), None)
+            get_bulkhead(name).configure(
+                limit=limit,
+                queue=parse_int_param(cfg.get("queue"), None),
+                max_wait=max_wait_ms / 1000 if max_wait_ms is not None else None,
+            )
+
+    return json_response({"pid": os.getpid(), "bulkheads": {name: get_bulkhead(name).stats() for name in _BULKHEAD_DEFAULTS}})
 
 
 # ===================== GEMINI CONFIG =====================
@@ -22,12 +736,36 @@ otp_store = {}
 # Get Gemini API key from environment variable (Render → Environment tab)
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
+# API base (overridable so load tests / benchmarks can point at a local fake)
+GEMINI_API_BASE = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1").rstrip("/")
+
 # Primary model endpoint (current/recommended)
 DEFAULT_MODEL_NAME = "gemini-2.5-flash"
-MODEL_URL = f"https://generativelanguage.googleapis.com/v1/models/{DEFAULT_MODEL_NAME}:generateContent"
+MODEL_URL = f"{GEMINI_API_BASE}/models/{DEFAULT_MODEL_NAME}:generateContent"
 
 # Models list endpoint (used for fallback/discovery)
-MODELS_LIST_URL = "https://generativelanguage.googleapis.com/v1/models"
+MODELS_LIST_URL = f"{GEMINI_API_BASE}/models"
+
+# One HTTP session per worker with a connection pool sized for the request threads:
+# keeps TLS connections to Gemini alive between calls (and lets warm_up() open them
+# before traffic arrives). Only stateless calls go through it – no cookies / auth state.
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", os.environ.get("GUNICORN_THREADS", 16)))
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
 
 
 # ===================== GOOGLE SHEETS CONFIG =====================
@@ -38,6 +776,28 @@ GOOGLE_SHEET_ID = os.environ.get("GOOGLE_SHEET_ID")                          # s
 TRIPPLAN_SHEET_NAME = os.environ.get("TRIPPLAN_SHEET_NAME", "TripPlans")    # sheet/tab name
 
 
+BOOKINGS_SHEET_NAME = os.environ.get("BOOKINGS_SHEET_NAME", "Bookings")
+
+# Service-account credentials are shared by the whole worker, so the OAuth token is
+# fetched once (and refreshed once) instead of per thread. gspread clients wrap a
+# requests session, which isn't safe to share between threads → one client per thread.
+_gspread_creds = None
+_gspread_creds_lock = threading.Lock()
+_gspread_local = threading.local()
+
+
+def _get_gspread_credentials():
+    global _gspread_creds
+    if _gspread_creds is None:
+        with _gspread_creds_lock:
+            if _gspread_creds is None:
+                sa_info = json.loads(GOOGLE_SERVICE_ACCOUNT_JSON)
+                # read + write scope
+                scopes = ["https://www.googleapis.com/auth/spreadsheets"]
+                _gspread_creds = google_service_account.Credentials.from_service_account_info(sa_info, scopes=scopes)
+    return _gspread_creds
+
+
 def get_gspread_client():
     """
     Create a gspread client using service account JSON from env.
@@ -46,29 +806,402 @@ def get_gspread_client():
     if not GOOGLE_SERVICE_ACCOUNT_JSON or not GOOGLE_SHEET_ID:
         raise RuntimeError("Google Sheets not configured (GOOGLE_SERVICE_ACCOUNT_JSON / GOOGLE_SHEET_ID missing).")
 
-    sa_info = json.loads(GOOGLE_SERVICE_ACCOUNT_JSON)
-    # read + write scope
-    scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-    creds = Credentials.from_service_account_info(sa_info, scopes=scopes)
-    client = gspread.authorize(creds)
+    client = getattr(_gspread_local, "client", None)
+    if client is not None:
+        return client
+
+    client = gspread.authorize(_get_gspread_credentials())
+    _gspread_local.client = client
     return client
 
 
+def get_spreadsheet():
+    """The configured spreadsheet, opened once per thread (open_by_key is an API call)."""
+    sh = getattr(_gspread_local, "spreadsheet", None)
+    if sh is None:
+        client = get_gspread_client()
+        with observe_upstream("sheets", "open_by_key"):
+            sh = client.open_by_key(GOOGLE_SHEET_ID)
+        _gspread_local.spreadsheet = sh
+    return sh
+
+
+# ===================== SHEET SNAPSHOT CACHE =====================
+
+# Read-only lookups (/get-trip-plan, /get-bookings) share one recent copy of each
+# worksheet instead of calling get_all_values() per request. Off by default (0): with
+# a TTL, lookups can trail edits made outside this service by up to that many seconds
+# unless the sheet reports them through /sheets/changed. 30 is a good value with it.
+SHEET_CACHE_TTL_SECONDS = float(os.environ.get("SHEET_CACHE_TTL_SECONDS", 0))
+
+
+class SheetSnapshotCache:
+    """
+    Per-worker cache of worksheet values: { sheet_name: (fetched_at, rows) }.
+    A per-sheet lock makes concurrent misses wait for one fetch instead of all
+    hitting the Sheets API.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._snapshots = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+
+    def _sheet_lock(self, name):
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _fresh(self, name):
+        entry = self._snapshots.get(name)
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    def get_rows(self, name: str, fetch):
+        """Rows of worksheet `name`, calling fetch() when the snapshot is missing or stale."""
+        if self.ttl <= 0:
+            return fetch()
+
+        rows = self._fresh(name)
+        if rows is not None:
+            self.hits += 1
+            return rows
+
+        with self._sheet_lock(name):
+            rows = self._fresh(name)  # filled while we waited?
+            if rows is not None:
+                self.hits += 1
+                return rows
+            self.misses += 1
+            try:
+                rows = fetch()
+            except BulkheadRejected:
+                # Sheets is saturated: a stale copy beats a 503 for read-only lookups
+                entry = self._snapshots.get(name)
+                if entry is None:
+                    raise
+                self.stale_served += 1
+                return entry[1]
+            self._snapshots[name] = (time.time(), rows)
+            return rows
+
+    def apply_change(self, name: str, action: str, start_row: int = None, rows: list = None) -> str:
+        """
+        Patch a cached worksheet with rows written at sheet row `start_row` (1-based,
+        header = row 1), or drop it when the change can't be applied exactly.
+        Returns "patched", "invalidated" or "not_cached".
+        """
+        with self._sheet_lock(name):  # waits for an in-flight fetch, then fixes up its result
+            entry = self._snapshots.get(name)
+            if entry is None:
+                return "not_cached"
+            fetched_at, current = entry
+            if rows and start_row:
+                # only when our copy lines up with the write, e.g. it already holds
+                # the appended rows if it was fetched after the write
+                if action == "append" and start_row == len(current) + 1:
+                    self._snapshots[name] = (fetched_at, current + rows)
+                    return "patched"
+                if action == "update" and 2 <= start_row and start_row - 1 + len(rows) <= len(current):
+                    patched = list(current)
+                    patched[start_row - 1:start_row - 1 + len(rows)] = rows
+                    self._snapshots[name] = (fetched_at, patched)
+                    return "patched"
+            self._snapshots.pop(name, None)
+            return "invalidated"
+
+    def invalidate(self, name: str = None):
+        with self._lock:
+            if name is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(name, None)
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_served": self.stale_served,
+            "sheets": {name: {"rows": len(rows), "age_seconds": round(now - ts, 1)}
+                       for name, (ts, rows) in list(self._snapshots.items())},
+        }
+
+
+sheet_cache = SheetSnapshotCache(SHEET_CACHE_TTL_SECONDS)
+
+
+def get_sheet_rows(sheet_name: str):
+    """All values of a worksheet (header row included), served from the snapshot cache."""
+    def fetch():
+        sh = get_spreadsheet()
+        with observe_upstream("sheets", "worksheet"):
+            ws = sh.worksheet(sheet_name)
+        with observe_upstream("sheets", "get_all_values"):
+            return ws.get_all_values()
+
+    return sheet_cache.get_rows(sheet_name, fetch)
+
+
+# ===================== SHEET CHANGE NOTIFICATIONS (/sheets/changed) =====================
+
+# The Apps Script writers call /sheets/changed after touching TripPlans / Bookings.
+# The answering worker patches (or drops) its snapshot right away and publishes the
+# change with Postgres NOTIFY; every worker of every instance LISTENs and does the
+# same, so with this wired up SHEET_CACHE_TTL_SECONDS can safely be turned on.
+SHEETS_WEBHOOK_TOKEN = os.environ.get("SHEETS_WEBHOOK_TOKEN")
+SHEETS_CHANGED_CHANNEL = "sheets_changed"
+# NOTIFY payloads are limited to 8000 bytes; bigger changes are sent without the rows
+SHEETS_NOTIFY_MAX_BYTES = 7500
+
+# tells this process's own notifications apart from everyone else's
+_sheet_change_origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_sheet_listener = None
+
+
+def _sheets_webhook_authorized() -> bool:
+    """X-Webhook-Token must match SHEETS_WEBHOOK_TOKEN (the admin token works too)."""
+    token = request.headers.get("X-Webhook-Token", "")
+    if SHEETS_WEBHOOK_TOKEN and hmac.compare_digest(token, SHEETS_WEBHOOK_TOKEN):
+        return True
+    return _admin_authorized()
+
+
+def apply_sheet_change(change: dict) -> str:
+    """Apply one change to this worker's caches; returns "patched" / "invalidated" / "not_cached"."""
+    sheet = change.get("sheet")
+    if not sheet:
+        sheet_cache.invalidate()
+        return "invalidated"
+    return sheet_cache.apply_change(sheet, change.get("action", "invalidate"), change.get("start_row"), change.get("rows"))
+
+
+def publish_sheet_change(change: dict) -> str:
+    """Tell the other workers / instances. Returns "notify", or "local" without Postgres."""
+    if not DATABASE_URL:
+        return "local"
+    payload = json.dumps(dict(change, origin=_sheet_change_origin))
+    if len(payload.encode()) > SHEETS_NOTIFY_MAX_BYTES:
+        payload = json.dumps({"sheet": change.get("sheet"), "action": "invalidate", "origin": _sheet_change_origin})
+    with db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_notify(%s, %s);", (SHEETS_CHANGED_CHANNEL, payload))
+        conn.commit()
+        cur.close()
+    return "notify"
+
+
+def _listen_for_sheet_changes():
+    """Listener thread: own autocommit connection (LISTEN can't use the pool), reconnects with backoff."""
+    backoff = 1
+    connected_before = False
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(DATABASE_URL)
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {SHEETS_CHANGED_CHANNEL};")
+            if connected_before:
+                sheet_cache.invalidate()  # changes while we were disconnected are unknown
+            connected_before = True
+            backoff = 1
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    cur.execute("SELECT 1;")  # notices a dead connection
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    note = conn.notifies.pop(0)
+                    try:
+                        change = json.loads(note.payload)
+                    except ValueError:
+                        change = {}
+                    if change.get("origin") != _sheet_change_origin:
+                        apply_sheet_change(change)
+        except Exception as e:
+            print("SHEET CHANGE LISTENER ERROR:", e)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+def start_sheet_change_listener():
+    """Start this worker's LISTEN thread once (no-op without DATABASE_URL)."""
+    global _sheet_listener
+    if DATABASE_URL and (_sheet_listener is None or not _sheet_listener.is_alive()):
+        _sheet_listener = threading.Thread(target=_listen_for_sheet_changes, name="sheet-changes", daemon=True)
+        _sheet_listener.start()
+
+
+@app.route("/sheets/changed", methods=["POST"])
+def sheets_changed_route():
+    """
+    Webhook for the Apps Script writers (header X-Webhook-Token).
+
+    Input (JSON):
+      {"sheet": "Bookings", "action": "append", "start_row": 120, "rows": [[...], ...]}
+        action:    append | update | delete | invalidate (default)
+        start_row: 1-based sheet row of rows[0] (header is row 1)
+        rows:      the new values – send getDisplayValues() so they match get_all_values()
+      Without usable rows (or if the cached copy doesn't line up with start_row) the
+      worksheet's snapshot is dropped instead and re-read on next use.
+      {"sheet": null} / no sheet → drop every snapshot.
+    """
+    if not _sheets_webhook_authorized():
+        return json_response({"status": "error", "message": "Forbidden"}, status=403)
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return json_response({"status": "error", "message": "Expected a JSON object"}, status=400)
+
+    change = {
+        "sheet": str(data.get("sheet") or "").strip() or None,
+        "action": str(data.get("action") or "invalidate").strip().lower(),
+        "start_row": parse_int_param(data.get("start_row"), None),
+    }
+    if change["action"] not in ("append", "update", "delete", "invalidate"):
+        return json_response({"status": "error", "message": "Unknown action"}, status=400)
+    rows = data.get("rows")
+    if isinstance(rows, list) and rows and all(isinstance(r, list) for r in rows):
+        change["rows"] = [["" if v is None else str(v) for v in r] for r in rows]
+
+    applied = apply_sheet_change(change)
+    try:
+        fanout = publish_sheet_change(change)
+    except Exception as e:
+        # this worker is up to date; the others catch up when their snapshots expire
+        print("SHEET CHANGE NOTIFY ERROR:", e)
+        fanout = "failed"
+    return json_response({"status": "ok", "applied": applied, "fanout": fanout})
+
+
 # ===================== POSTGRES CONFIG (for images) =====================
 
 DATABASE_URL = os.environ.get("DATABASE_URL")  # Render Postgres URL
 
+# Public URL of this service, used to build absolute image URLs for Zoho cards
+PUBLIC_BASE_URL = os.environ.get("PUBLIC_BASE_URL", "https://apia2m.onrender.com").rstrip("/")
+
+# Initial featured_packages rows (also served if the catalogue can't be read at all)
+DEFAULT_FEATURED_PACKAGES = [
+    {
+        "id": "goa_pkg",
+        "name": "Goa Beach Escape – 3D/2N",
+        "price_text": "₹7,499 per person",
+        "image_id": 3,
+        "btn_label": "View Goa Plan",
+        "btn_payload": "Goa Package",
+    },
+    {
+        "id": "manali_pkg",
+        "name": "Manali Snow Adventure – 5D/4N",
+        "price_text": "₹12,999 per person",
+        "image_id": 4,
+        "btn_label": "View Manali Plan",
+        "btn_payload": "Manali Package",
+    },
+]
+
+
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+# Default: one connection per request thread (see gunicorn.conf.py)
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", os.environ.get("GUNICORN_THREADS", 16)))
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+_instrumented_cursor_cls = None
+
+
+def get_cursor_factory():
+    """
+    psycopg2 cursor class that times every execute / COPY into the postgres upstream
+    metrics (labelled "<verb> <table>"). Built on first use so psycopg2 stays lazy.
+    """
+    global _instrumented_cursor_cls
+    if _instrumented_cursor_cls is None:
+        class InstrumentedCursor(psycopg2.extensions.cursor):
+            def execute(self, query, vars=None):
+                with observe_upstream("postgres", _sql_operation(query), admit=False):
+                    return super().execute(query, vars)
+
+            def copy_expert(self, sql, file, size=8192):
+                with observe_upstream("postgres", _sql_operation(sql), admit=False):
+                    return super().copy_expert(sql, file, size)
+
+        _instrumented_cursor_cls = InstrumentedCursor
+    return _instrumented_cursor_cls
+
 
 def get_db_conn():
     if not DATABASE_URL:
         raise RuntimeError("DATABASE_URL not configured")
-    conn = psycopg2.connect(DATABASE_URL)
+    conn = psycopg2.connect(DATABASE_URL, cursor_factory=get_cursor_factory())
     return conn
 
 
+def get_db_pool():
+    """Per-process connection pool (created on first use)."""
+    global _db_pool
+    if _db_pool is None:
+        if not DATABASE_URL:
+            raise RuntimeError("DATABASE_URL not configured")
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = psycopg2_pool.ThreadedConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX, DATABASE_URL, cursor_factory=get_cursor_factory()
+                )
+    return _db_pool
+
+
+@contextmanager
+def db_conn():
+    """
+    Borrow a pooled connection:
+
+        with db_conn() as conn:
+            cur = conn.cursor()
+            ...
+            conn.commit()
+
+    Anything not committed is rolled back before the connection goes back to the pool;
+    broken connections are discarded instead of reused. Borrowing goes through the
+    "postgres" bulkhead, so a saturated pool queues briefly and then rejects.
+    """
+    with get_bulkhead("postgres") or nullcontext():
+        pool = get_db_pool()
+        conn = pool.getconn()
+        broken = False
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            broken = True
+            raise
+        finally:
+            if not broken and not conn.closed:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            pool.putconn(conn, close=broken or bool(conn.closed))
+
+
 def init_db():
     """
-    Create table for storing images if not exists.
+    Create tables for storing images if not exists, and apply the
+    (idempotent) image schema migrations + backfills.
     Run once at startup.
     """
     conn = get_db_conn()
@@ -84,40 +1217,496 @@ def init_db():
         );
         """
     )
+    # Content hash used as the strong ETag for /image/<id>.
+    # Rows are never modified, so the hash is computed once (at upload time,
+    # or here for rows uploaded before the column existed).
+    cur.execute("ALTER TABLE uploaded_images ADD COLUMN IF NOT EXISTS sha256 TEXT;")
+    cur.execute(
+        """
+        UPDATE uploaded_images
+        SET sha256 = encode(sha256(data), 'hex')
+        WHERE sha256 IS NULL;
+        """
+    )
+    # Original dimensions (older rows; new uploads record them on image_blobs).
+    cur.execute("ALTER TABLE uploaded_images ADD COLUMN IF NOT EXISTS width INTEGER;")
+    cur.execute("ALTER TABLE uploaded_images ADD COLUMN IF NOT EXISTS height INTEGER;")
+    cur.execute("CREATE INDEX IF NOT EXISTS uploaded_images_sha256_idx ON uploaded_images (sha256);")
+    # /api/images: filter by content type + date range, keyset-paginated on id
+    cur.execute(
+        """
+        CREATE INDEX IF NOT EXISTS uploaded_images_ctype_created_idx
+        ON uploaded_images (content_type, created_at, id);
+        """
+    )
+
+    # Content-addressed blob store: one row per distinct image content.
+    # uploaded_images keeps the per-upload id/filename record and points here via sha256.
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS image_blobs (
+            sha256 TEXT PRIMARY KEY,
+            content_type TEXT NOT NULL,
+            byte_size INTEGER NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            data BYTEA NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT NOW()
+        );
+        """
+    )
+    # Backfill: move bytes of pre-dedup rows into image_blobs (one copy per hash),
+    # then drop the duplicated inline copies. Both steps are no-ops once migrated.
+    cur.execute("ALTER TABLE uploaded_images ALTER COLUMN data DROP NOT NULL;")
+    cur.execute(
+        """
+        INSERT INTO image_blobs (sha256, content_type, byte_size, width, height, data)
+        SELECT DISTINCT ON (sha256) sha256, content_type, octet_length(data), width, height, data
+        FROM uploaded_images
+        WHERE data IS NOT NULL
+        ORDER BY sha256, id
+        ON CONFLICT (sha256) DO NOTHING;
+        """
+    )
+    # Where the bytes of each blob live ('postgres' → data column, 'filesystem' → IMAGE_STORAGE_DIR).
+    cur.execute("ALTER TABLE image_blobs ADD COLUMN IF NOT EXISTS storage TEXT NOT NULL DEFAULT 'postgres';")
+    cur.execute("ALTER TABLE image_blobs ALTER COLUMN data DROP NOT NULL;")
+    cur.execute(
+        """
+        UPDATE uploaded_images i
+        SET data = NULL
+        FROM image_blobs b
+        WHERE i.data IS NOT NULL AND b.sha256 = i.sha256;
+        """
+    )
+
+    # Featured packages catalogue (served by /featured-packages)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS featured_packages (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            price_text TEXT NOT NULL,
+            image_id INTEGER,
+            btn_label TEXT NOT NULL DEFAULT '',
+            btn_payload TEXT NOT NULL DEFAULT '',
+            sort_order INTEGER NOT NULL DEFAULT 0,
+            active BOOLEAN NOT NULL DEFAULT TRUE,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        """
+    )
+    # seed with the packages that used to be hardcoded (only if the table is empty)
+    cur.execute("SELECT 1 FROM featured_packages LIMIT 1;")
+    if cur.fetchone() is None:
+        execute_values(
+            cur,
+            """
+            INSERT INTO featured_packages
+                (id, name, price_text, image_id, btn_label, btn_payload, sort_order)
+            VALUES %s
+            ON CONFLICT (id) DO NOTHING;
+            """,
+            [
+                (p["id"], p["name"], p["price_text"], p["image_id"], p["btn_label"], p["btn_payload"], n)
+                for n, p in enumerate(DEFAULT_FEATURED_PACKAGES)
+            ],
+        )
+    # Resized WebP/JPEG/PNG derivatives, keyed by the content hash of the original.
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS image_variants (
+            id SERIAL PRIMARY KEY,
+            source_sha256 TEXT NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            format TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            byte_size INTEGER NOT NULL,
+            data BYTEA NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            UNIQUE (source_sha256, width, format)
+        );
+        """
+    )
+    # Asynchronous /trip-plan/jobs; at most one queued/running job per request_key
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS trip_plan_jobs (
+            id TEXT PRIMARY KEY,
+            request_key TEXT NOT NULL,
+            params JSONB NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            result_text TEXT,
+            result_status INTEGER,
+            callback_url TEXT,  -- first submitter's; every attached caller's URL is in callbacks
+            callback_status TEXT,
+            callbacks JSONB NOT NULL DEFAULT '{}'::jsonb,  -- { url: "pending" | delivery outcome }
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            finished_at TIMESTAMPTZ
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS trip_plan_jobs_active_key_idx
+        ON trip_plan_jobs (request_key) WHERE status IN ('queued', 'running');
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS trip_plan_jobs_key_finished_idx ON trip_plan_jobs (request_key, finished_at);"
+    )
+    # one callback per attached caller (tables created before this had just callback_url)
+    cur.execute("ALTER TABLE trip_plan_jobs ADD COLUMN IF NOT EXISTS callbacks JSONB NOT NULL DEFAULT '{}'::jsonb;")
+    cur.execute(
+        """
+        UPDATE trip_plan_jobs
+        SET callbacks = jsonb_build_object(callback_url, COALESCE(callback_status, 'pending'))
+        WHERE callback_url IS NOT NULL AND callbacks = '{}'::jsonb;
+        """
+    )
+    # stale-job sweep
+    cur.execute(
+        """
+        CREATE INDEX IF NOT EXISTS trip_plan_jobs_active_updated_idx
+        ON trip_plan_jobs (updated_at) WHERE status IN ('queued', 'running');
+        """
+    )
     conn.commit()
     cur.close()
     conn.close()
 
-# ---- DB init at startup (Flask 3 safe) ----
-try:
-    init_db()
-    print("✅ DB initialized (uploaded_images table ready).")
-except Exception as e:
-    print("❌ DB INIT ERROR:", e)
+def run_db_migrations() -> bool:
+    """
+    One-time schema setup / migrations. Not run on import: gunicorn's master runs it
+    once before forking workers (see gunicorn.conf.py), or run `flask --app app init-db`
+    as a deploy step.
+    """
+    try:
+        init_db()
+        print("✅ DB initialized (uploaded_images table ready).")
+        return True
+    except Exception as e:
+        print("❌ DB INIT ERROR:", e)
+        return False
+
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Create / migrate the Postgres tables."""
+    if not run_db_migrations():
+        raise SystemExit(1)
+
+# ===================== TRIP PLAN MATCHING (canonical keys) =====================
+
+# "Goa", "goa ", "Goa, India" and "North Goa" are the same trip; so are budgets of
+# 5000 and 5200. Places resolve through an alias table, then with generic words
+# ("trip", "beach", ...) stripped, then edit distance (accepted at >= TRIP_PLAN_MATCH_THRESHOLD
+# similarity). Budgets match when they differ by at most TRIP_PLAN_BUDGET_TOLERANCE
+# (relative): keys use log-scale buckets that wide, and lookups also check the two
+# neighbouring buckets so budgets either side of a bucket edge still meet.
+TRIP_PLAN_MATCH_THRESHOLD = float(os.environ.get("TRIP_PLAN_MATCH_THRESHOLD", 0.8))
+TRIP_PLAN_BUDGET_TOLERANCE = float(os.environ.get("TRIP_PLAN_BUDGET_TOLERANCE", 0.15))
+# normalize() results kept per worker (LRU) – inputs come straight from public requests
+TRIP_PLAN_MATCH_MEMO_MAX = int(os.environ.get("TRIP_PLAN_MATCH_MEMO_MAX", 10000))
+# optional JSON file { "canonical": ["alias", ...] } merged into PLACE_ALIASES
+TRIP_PLAN_ALIASES_FILE = os.environ.get("TRIP_PLAN_ALIASES_FILE")
+
+PLACE_ALIASES = {
+    "goa": ["north goa", "south goa", "panaji", "panjim", "goa india"],
+    "bangalore": ["bengaluru", "blr", "bangaluru"],
+    "mumbai": ["bombay"],
+    "chennai": ["madras"],
+    "delhi": ["new delhi", "ncr"],
+    "gurgaon": ["gurugram"],
+    "kolkata": ["calcutta"],
+    "kochi": ["cochin", "ernakulam"],
+    "pondicherry": ["puducherry", "pondy"],
+    "mysore": ["mysuru"],
+    "ooty": ["udhagamandalam", "ootacamund", "udagamandalam"],
+    "coorg": ["kodagu", "madikeri"],
+    "kodaikanal": ["kodai"],
+    "trivandrum": ["thiruvananthapuram"],
+    "calicut": ["kozhikode"],
+    "alleppey": ["alappuzha"],
+    "varanasi": ["benaras", "banaras", "kashi"],
+    "shimla": ["simla"],
+    "manali": ["kullu manali"],
+    "munnar": [],
+    "madurai": [],
+    "rameswaram": ["rameshwaram"],
+    "kanyakumari": ["cape comorin"],
+    "tirupati": ["tirumala"],
+    "hyderabad": ["secunderabad"],
+    "visakhapatnam": ["vizag"],
+    "andaman": ["andaman and nicobar", "port blair", "havelock"],
+    "leh": ["ladakh", "leh ladakh"],
+    "srinagar": ["kashmir"],
+    "rishikesh": [],
+    "jaipur": ["pink city"],
+    "udaipur": [],
+    "trichy": ["tiruchirappalli", "tiruchi"],
+    "mahabalipuram": ["mamallapuram"],
+    "dharamshala": ["dharamsala", "mcleodganj", "mcleod ganj"],
+    "aurangabad": ["chhatrapati sambhajinagar"],
+}
+if TRIP_PLAN_ALIASES_FILE:
+    with open(TRIP_PLAN_ALIASES_FILE) as f:
+        for _canon, _aliases in json.load(f).items():
+            PLACE_ALIASES.setdefault(_canon.lower(), []).extend(a.lower() for a in _aliases)
+
+# Generic words ignored when looking a place up (never directions – "West Bengal",
+# "North Goa" are names in their own right). Places that don't resolve keep them.
+_PLACE_NOISE_WORDS = {
+    "india", "city", "district", "the", "trip", "tour", "town", "package", "holiday",
+    "beach", "hills", "hill", "station",
+}
+
+
+def _place_segments(text) -> list:
+    """Lowercased, punctuation-free comma segments: "Goa, India!" → ["goa", "india"]."""
+    segments = []
+    for seg in str(text or "").lower().split(","):
+        seg = " ".join(re.sub(r"[^\w\s]", " ", seg).split())
+        if seg:
+            segments.append(seg)
+    return segments
+
+
+def _similarity(a: str, b: str) -> float:
+    """
+    1 - edit distance / longer length, where the distance counts insertions, deletions,
+    substitutions and adjacent swaps ("munar" ~ "munnar" 0.83). Returns 0 as soon as
+    the result can no longer reach the threshold.
+    """
+    longest = max(len(a), len(b))
+    if not longest:
+        return 1.0
+    max_dist = int(longest * (1 - TRIP_PLAN_MATCH_THRESHOLD))
+    if abs(len(a) - len(b)) > max_dist:
+        return 0.0
+    before, prev = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            d = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                d = min(d, before[j - 2] + 1)
+            cur.append(d)
+        if min(cur) > max_dist:
+            return 0.0
+        before, prev = prev, cur
+    return 1 - prev[-1] / longest
+
+
+class PlaceNormalizer:
+    """
+    Maps free-text places to a canonical name. The vocabulary is PLACE_ALIASES plus
+    places learned from the TripPlans sheet; results are memoized per input string in
+    an LRU of at most `memo_max` entries.
+    normalize() returns (canonical, score) with score 1.0 for exact / alias matches.
+    """
+
+    def __init__(self, aliases: dict, memo_max: int = TRIP_PLAN_MATCH_MEMO_MAX):
+        self._names = {}  # cleaned name / alias → canonical
+        for canon, names in aliases.items():
+            self._names[canon] = canon
+            for name in names:
+                self._names[name] = canon
+        self.memo_max = memo_max
+        self._memo = OrderedDict()
+        self._generation = 0  # bumped when the vocabulary grows; older results aren't memoized
+        self._learned_from = set()
+        self._lock = threading.Lock()
+
+    def _resolve(self, text):
+        """(canonical, score, known) – known=False means nothing matched and canonical is the input."""
+        segments = _place_segments(text)
+        if not segments:
+            return "", 0.0, False
+        names = self._names
+
+        for candidate in [" ".join(segments)] + segments:
+            if candidate in names:
+                return names[candidate], 1.0, True
+
+        # "Goa trip", "Ooty hill station" → the name without the generic words. No
+        # matching on a word *inside* a longer name: "Navi Mumbai" is not Mumbai.
+        stripped = [" ".join(w for w in seg.split() if w not in _PLACE_NOISE_WORDS) for seg in segments]
+        for seg in stripped:
+            if seg in names:
+                return names[seg], 1.0, True
+
+        target = stripped[0] or segments[0]
+        best, best_score = None, 0.0
+        for name, canon in list(names.items()):
+            score = _similarity(target, name)
+            if score > best_score:
+                best, best_score = canon, score
+        if best is not None and best_score >= TRIP_PLAN_MATCH_THRESHOLD:
+            return best, round(best_score, 3), True
+        return segments[0], 1.0, False
+
+    def normalize(self, text):
+        key = str(text or "")
+        with self._lock:
+            hit = self._memo.get(key)
+            if hit is not None:
+                self._memo.move_to_end(key)
+                return hit
+            generation = self._generation
+        canon, score, _ = self._resolve(key)  # outside the lock – fuzzy matching is the slow part
+        hit = (canon, score)
+        with self._lock:
+            if generation != self._generation:
+                return hit
+            self._memo[key] = hit
+            while len(self._memo) > self.memo_max:
+                self._memo.popitem(last=False)
+        return hit
+
+    def learn(self, places):
+        """Add places (e.g. from the sheet) that nothing in the vocabulary matches yet."""
+        with self._lock:
+            added = False
+            for place in set(places) - self._learned_from:
+                self._learned_from.add(place)
+                canon, _, known = self._resolve(place)
+                if canon and not known:
+                    self._names[canon] = canon
+                    added = True
+            if added:
+                self._memo.clear()  # earlier misses may resolve to the new names now
+                self._generation += 1
+
+
+place_normalizer = PlaceNormalizer(PLACE_ALIASES)
+
+
+def budgets_close(a: float, b: float) -> bool:
+    return abs(a - b) / max(a, b, 1) <= TRIP_PLAN_BUDGET_TOLERANCE
+
+
+def budget_bucket(budget: float, offset: int = 0) -> int:
+    """
+    Log-scale bucket of a budget, as the bucket's representative rupee amount:
+    each bucket spans TRIP_PLAN_BUDGET_TOLERANCE relative to its neighbour, so 600
+    and 1400 differ while 4800 and 5200 share one. offset=±1 gives the neighbours.
+    """
+    if budget <= 0 or TRIP_PLAN_BUDGET_TOLERANCE <= 0:
+        return int(round(budget))
+    step = math.log1p(TRIP_PLAN_BUDGET_TOLERANCE)
+    return int(round(math.exp((round(math.log(budget) / step) + offset) * step)))
+
+
+def trip_plan_key(start, travel, days, budget) -> dict:
+    """
+    Canonical identity of a trip request:
+      {"key": "chennai|goa|3|4978", "neighbor_keys": [...], "start": ..., "travel": ...,
+       "days": 3, "budget": 4978, "score": 1.0}
+    `budget` may be a number or text such as "₹5,000" / "3000-6000"; neighbor_keys are
+    the keys of the adjacent budget buckets.
+    """
+    start_c, start_score = place_normalizer.normalize(start)
+    travel_c, travel_score = place_normalizer.normalize(travel)
+    days = parse_int_param(days)
+    amount = parse_budget(budget)
+    bucket = budget_bucket(amount)
+    prefix = f"{start_c}|{travel_c}|{days}|"
+    neighbors = {budget_bucket(amount, -1), budget_bucket(amount, 1)} - {bucket}
+    return {
+        "key": f"{prefix}{bucket}",
+        "neighbor_keys": [f"{prefix}{b}" for b in sorted(neighbors)],
+        "start": start_c,
+        "travel": travel_c,
+        "days": days,
+        "budget": bucket,
+        "score": min(start_score, travel_score),
+    }
+
+
+# Gemini output per canonical trip key, so equivalent /trip-plan requests don't each
+# generate a plan. 0 disables.
+TRIP_PLAN_CACHE_TTL_SECONDS = float(os.environ.get("TRIP_PLAN_CACHE_TTL_SECONDS", 6 * 3600))
+TRIP_PLAN_CACHE_MAX_ENTRIES = int(os.environ.get("TRIP_PLAN_CACHE_MAX_ENTRIES", 2000))
+
+
+class TripPlanCache:
+    """Per-worker LRU of { canonical key: (stored_at, ai_text, request it was generated for) }."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, neighbor_keys=(), budget: float = None):
+        """
+        (ai_text, source request) or None. Entries under neighbor_keys count only
+        when their source request's budget is budgets_close() to `budget`.
+        """
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            now = time.time()
+            for k in [key, *neighbor_keys]:
+                entry = self._entries.get(k)
+                if entry is None or now - entry[0] > self.ttl:
+                    continue
+                if k != key and (budget is None or not budgets_close(entry[2][3], budget)):
+                    continue
+                self._entries.move_to_end(k)
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, ai_text: str, source):
+        if self.ttl <= 0 or not ai_text:
+            return
+        with self._lock:
+            self._entries[key] = (time.time(), ai_text, source)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"ttl_seconds": self.ttl, "entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+trip_plan_cache = TripPlanCache(TRIP_PLAN_CACHE_TTL_SECONDS, TRIP_PLAN_CACHE_MAX_ENTRIES)
+
+
+def header_safe(value) -> str:
+    """Header values must be latin-1; percent-encode anything else (e.g. Tamil place names)."""
+    return urllib.parse.quote(str(value), safe="|:;,.=- ")
+
+
+def _trip_plan_match_headers(match: str, score: float, key: str) -> dict:
+    """X-Trip-Plan-Match: exact | near (the caller asked for something equivalent, not identical)."""
+    return {
+        "X-Trip-Plan-Match": match,
+        "X-Trip-Plan-Match-Score": f"{score:.3f}",
+        "X-Trip-Plan-Key": header_safe(key),
+    }
+
 
 # ===================== TRIP PLAN SHEET HELPERS =====================
 
-def find_trip_plan(start, travel, days, budget):
+class TripPlanIndex:
     """
+    TripPlans rows grouped by (start, travel, days) canonical places, newest first.
+    Built once per sheet snapshot.
+
     TripPlans sheet structure (row appended by Apps Script):
 
     [ Timestamp, Start Location, Travel Location, Days, Budget, Trip Plan ]
       A           B               C              D     E       F
     """
-    client = get_gspread_client()
-    sh = client.open_by_key(GOOGLE_SHEET_ID)
-    ws = sh.worksheet(TRIPPLAN_SHEET_NAME)
-
-    rows = ws.get_all_values()
-    if len(rows) < 2:
-        return ""
-
-    data_rows = rows[1:]  # skip header
-
-    start = (start or "").strip().lower()
-    travel = (travel or "").strip().lower()
-    days = str(days or "").strip()
-    budget = str(budget or "").strip()
 
     START_COL = 1   # B
     TRAVEL_COL = 2  # C
@@ -125,20 +1714,189 @@ def find_trip_plan(start, travel, days, budget):
     BUDGET_COL = 4  # E
     PLAN_COL = 5    # F
 
-    # Search from last row (latest entry)
-    for r in reversed(data_rows):
-        if len(r) <= PLAN_COL:
-            continue
+    def __init__(self, rows):
+        data_rows = [r for r in rows[1:] if len(r) > self.PLAN_COL]  # skip header
+        place_normalizer.learn({str(r[c]) for r in data_rows for c in (self.START_COL, self.TRAVEL_COL)})
+
+        self.groups = {}
+        for r in reversed(data_rows):
+            start_c, _ = place_normalizer.normalize(r[self.START_COL])
+            travel_c, _ = place_normalizer.normalize(r[self.TRAVEL_COL])
+            group_key = (start_c, travel_c, parse_int_param(r[self.DAYS_COL]))
+            self.groups.setdefault(group_key, []).append(r)
+
+    def match(self, start, travel, days, budget):
+        """Best row for the request as a dict (plan, match, score, key, row), or None."""
+        want = trip_plan_key(start, travel, days, budget)
+        if want["score"] < TRIP_PLAN_MATCH_THRESHOLD:
+            return None
+        candidates = self.groups.get((want["start"], want["travel"], want["days"]))
+        if not candidates:
+            return None
+
+        raw = [str(v or "").strip().lower() for v in (start, travel, days, budget)]
+        want_budget = parse_budget(budget)
+        best, best_diff = None, None
+        for r in candidates:  # newest first
+            row_raw = [str(r[c] or "").strip().lower()
+                       for c in (self.START_COL, self.TRAVEL_COL, self.DAYS_COL, self.BUDGET_COL)]
+            if row_raw == raw:
+                best, best_diff = r, -1.0  # exact – nothing beats it
+                break
+            row_budget = parse_budget(r[self.BUDGET_COL])
+            diff = abs(row_budget - want_budget) / max(want_budget, row_budget, 1)
+            if budgets_close(row_budget, want_budget) and (best_diff is None or diff < best_diff):
+                best, best_diff = r, diff
+        if best is None:
+            return None
+
+        return {
+            "plan": str(best[self.PLAN_COL] or ""),
+            "match": "exact" if best_diff < 0 else "near",
+            "score": want["score"],
+            "key": want["key"],
+            "row": {
+                "start_location": best[self.START_COL],
+                "travel_location": best[self.TRAVEL_COL],
+                "days": best[self.DAYS_COL],
+                "budget": best[self.BUDGET_COL],
+            },
+        }
+
+
+_trip_plan_index = (None, None)  # (snapshot rows it was built from, TripPlanIndex)
 
-        r_start = str(r[START_COL] or "").strip().lower()
-        r_travel = str(r[TRAVEL_COL] or "").strip().lower()
-        r_days = str(r[DAYS_COL] or "").strip()
-        r_budget = str(r[BUDGET_COL] or "").strip()
 
-        if r_start == start and r_travel == travel and r_days == days and r_budget == budget:
-            return str(r[PLAN_COL] or "")
+def match_trip_plan(start, travel, days, budget):
+    """Exact or near-match TripPlans row for the request (see TripPlanIndex.match)."""
+    global _trip_plan_index
+    rows = get_sheet_rows(TRIPPLAN_SHEET_NAME)
+    built_from, index = _trip_plan_index
+    if built_from is not rows:
+        index = TripPlanIndex(rows)
+        _trip_plan_index = (rows, index)
+    return index.match(start, travel, days, budget)
+
+
+def find_trip_plan(start, travel, days, budget):
+    """Plan text of the best matching TripPlans row, or ""."""
+    found = match_trip_plan(start, travel, days, budget)
+    return found["plan"] if found else ""
+
+
+# ===================== REQUEST / RESPONSE HELPERS =====================
+
+try:
+    import orjson  # optional – faster JSON encoding
+except ImportError:
+    orjson = None
+
+# "orjson" (default when installed) or "json" – set JSON_ENCODER=json to force the stdlib.
+# Payloads orjson rejects (integers beyond 64 bits, ...) fall back to the stdlib; NaN /
+# Infinity floats come out as null under orjson instead of the stdlib's non-JSON NaN.
+JSON_ENCODER = os.environ.get("JSON_ENCODER", "orjson" if orjson is not None else "json")
+
+
+def _dumps_stdlib(obj) -> bytes:
+    return json.dumps(obj).encode("utf-8")
+
+
+def _dumps_orjson(obj) -> bytes:
+    try:
+        return orjson.dumps(obj)
+    except orjson.JSONEncodeError:
+        return _dumps_stdlib(obj)
+
 
-    return ""
+_json_encoders = {"json": _dumps_stdlib}
+if orjson is not None:
+    _json_encoders["orjson"] = _dumps_orjson
+
+
+def dumps_json(obj) -> bytes:
+    """Serialize to UTF-8 JSON bytes with the configured encoder."""
+    start = time.perf_counter()
+    body = _json_encoders.get(JSON_ENCODER, _dumps_stdlib)(obj)
+    profiler.record_phase("serialize", time.perf_counter() - start)
+    return body
+
+
+def json_response(obj, status: int = 200) -> Response:
+    return Response(dumps_json(obj), status=status, mimetype="application/json")
+
+
+def get_request_payload():
+    """
+    Decode the request input once and cache it for the rest of the request.
+
+    Precedence is JSON body → form → query string (same as every route used before).
+    Returns (data, source) with source one of "json", "form", "args", "none".
+    Parse errors propagate to the caller.
+    """
+    cached = g.get("_request_payload")
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    if request.is_json:
+        data = request.get_json(silent=True)
+        payload = (data if isinstance(data, dict) else {}, "json")
+    elif request.form:
+        payload = (request.form.to_dict(), "form")
+    elif request.args:
+        payload = (request.args.to_dict(), "args")
+    else:
+        payload = ({}, "none")
+    profiler.record_phase("parse", time.perf_counter() - start)
+
+    g._request_payload = payload
+    return payload
+
+
+def get_request_data(include_args: bool = True) -> dict:
+    """Request input as a dict; `include_args=False` ignores query-string only requests."""
+    data, source = get_request_payload()
+    if source == "args" and not include_args:
+        return {}
+    return data
+
+
+def get_str_param(data: dict, name: str) -> str:
+    return str(data.get(name) or "").strip()
+
+
+def parse_int_param(value, default: int = 0) -> int:
+    """Lenient int parsing ("3", 3, 3.0, " 3 ") – anything else gives `default`."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_budget(value) -> float:
+    """
+    Budget as a number. Supports plain numbers and ranges, using the midpoint:
+      "5000", 5000, "3000 - 6000", "3000-6000", "₹3000 – ₹6000", "₹3,000-₹6,000"
+    Returns 0 when it can't be parsed.
+    """
+    raw = str(value if value is not None else "").strip()
+    for ch in ("₹", ","):
+        raw = raw.replace(ch, "")
+
+    if any(x in raw for x in ("-", "–")):
+        parts = raw.replace("–", "-").split("-")
+        try:
+            min_b = float(parts[0].strip())
+            max_b = float(parts[1].strip())
+            return (min_b + max_b) / 2  # midpoint
+        except (IndexError, ValueError):
+            return 0
+    try:
+        return float(raw)
+    except ValueError:
+        return 0
 
 
 # ===================== BASIC ROUTES =====================
@@ -155,7 +1913,10 @@ def call_generate(model_url: str, api_key: str, payload: dict, timeout: int = 30
     Call the generateContent endpoint and return (resp_obj, status_code).
     """
     try:
-        r = requests.post(model_url, params={"key": api_key}, json=payload, timeout=timeout)
+        with observe_upstream("gemini", "generate_content") as span:
+            r = get_http_session().post(model_url, params={"key": api_key}, json=payload, timeout=timeout)
+            if not r.ok:
+                span["outcome"] = "error"
         return r, r.status_code
     except Exception as e:
         return {"error": f"Exception when calling model endpoint: {e}"}, 500
@@ -172,8 +1933,9 @@ def discover_and_pick_model(api_key: str):
     Returns model name or None.
     """
     try:
-        r = requests.get(MODELS_LIST_URL, params={"key": api_key}, timeout=15)
-        r.raise_for_status()
+        with observe_upstream("gemini", "list_models"):
+            r = get_http_session().get(MODELS_LIST_URL, params={"key": api_key}, timeout=15)
+            r.raise_for_status()
         data = r.json()
         models = []
 
@@ -220,80 +1982,35 @@ def discover_and_pick_model(api_key: str):
 
 # ===================== /trip-plan (Gemini) =====================
 
-@app.route("/trip-plan", methods=["GET", "POST"])
-def trip_plan():
-    # ---------- READ INPUT ----------
-    data = {}
-
-    try:
-        if request.is_json:
-            data = request.get_json(silent=True) or {}
-        elif request.form:
-            data = request.form.to_dict()
-        elif request.args:
-            data = request.args.to_dict()
-        else:
-            txt = (
-                "This endpoint expects: mode, start_location, travel_location, days, budget "
-                "via JSON body, form-data, or query parameters."
-            )
-            return Response(txt, mimetype="text/plain", status=400)
-    except Exception as e:
-        return Response(
-            f"Error parsing request: {e}",
-            mimetype="text/plain",
-            status=400,
-        )
-
-    mode = str(data.get("mode", "")).strip()
-    start_location = str(data.get("start_location", "")).strip()
-    travel_location = str(data.get("travel_location", "")).strip()
-
-    # days & budget as numbers
-    try:
-        days = int(data.get("days", 0))
-    except Exception:
-        days = 0
-
-    # --------- Budget support for both range string & numeric ---------
-    raw_budget = data.get("budget", "").strip()
-
-    # "3000 - 6000" , "3000-6000" , "₹3000 – ₹6000" support
-    if any(x in raw_budget for x in ["-", "–"]):
-        for ch in ["₹", ","]:
-            raw_budget = raw_budget.replace(ch, "")
-
-        parts = raw_budget.replace("–", "-").split("-")
-        try:
-            min_b = float(parts[0].strip())
-            max_b = float(parts[1].strip())
-            budget = (min_b + max_b) / 2  # midpoint
-        except:
-            budget = 0
-    else:
-        try:
-            budget = float(raw_budget)
-        except:
-            budget = 0
-
-    # ---------- MODE CHECK ----------
-    if mode != "TRIP_PLAN":
-        return Response("Unsupported mode", mimetype="text/plain", status=400)
+def read_trip_plan_input(data: dict):
+    """
+    (params, error) from request input: params has start_location, travel_location,
+    days (int) and budget (float; "3000 - 6000" style ranges use the midpoint).
+    `error` is a message for a 400, or None.
+    """
+    params = {
+        "start_location": get_str_param(data, "start_location"),
+        "travel_location": get_str_param(data, "travel_location"),
+        "days": parse_int_param(data.get("days", 0)),
+        "budget": parse_budget(data.get("budget", "")),
+    }
+    if not params["start_location"] or not params["travel_location"] or not params["days"] or not params["budget"]:
+        return params, "Invalid input. start_location, travel_location, days, budget are required."
+    if params["days"] <= 0:
+        return params, "Days must be greater than 0."
+    return params, None
 
-    # ---------- BASIC VALIDATION ----------
-    if not start_location or not travel_location or not days or not budget:
-        return Response(
-            "Invalid input. start_location, travel_location, days, budget are required.",
-            mimetype="text/plain",
-            status=400,
-        )
 
-    if days <= 0:
-        return Response(
-            "Days must be greater than 0.",
-            mimetype="text/plain",
-            status=400,
-        )
+def generate_trip_plan(params: dict):
+    """
+    Trip plan text for validated params (see read_trip_plan_input), from the plan
+    cache or Gemini. Returns (text, status, headers). Needs no request context, so
+    background jobs use it too.
+    """
+    start_location = params["start_location"]
+    travel_location = params["travel_location"]
+    days = params["days"]
+    budget = params["budget"]
 
     # ---------- BASE SUMMARY ----------
     per_day_budget = int(round(budget / days))
@@ -304,13 +2021,20 @@ def trip_plan():
         f"Approx budget per day (per person): ₹{per_day_budget}\n\n"
     )
 
+    # ---------- CACHE (equivalent requests share one generation) ----------
+    plan_key = trip_plan_key(start_location, travel_location, days, budget)
+    plan_request = (start_location.lower(), travel_location.lower(), days, budget)
+    cached = trip_plan_cache.get(plan_key["key"], plan_key["neighbor_keys"], budget)
+    if cached is not None:
+        ai_text, source_request = cached
+        headers = _trip_plan_match_headers("exact" if source_request == plan_request else "near",
+                                           plan_key["score"], plan_key["key"])
+        headers["X-Trip-Plan-Cache"] = "hit"
+        return base_text + ai_text, 200, headers
+
     # ---------- API KEY CHECK ----------
     if not GEMINI_API_KEY:
-        return Response(
-            base_text + "[Server error: GEMINI_API_KEY not configured.]",
-            mimetype="text/plain",
-            status=500,
-        )
+        return base_text + "[Server error: GEMINI_API_KEY not configured.]", 500, {}
 
     # ---------- PROMPT ----------
     prompt = (
@@ -357,15 +2081,15 @@ def trip_plan():
                 debug_info = resp.json()
             except Exception:
                 debug_info = str(resp)
-            return Response(
+            return (
                 base_text
                 + "\n[Gemini error response]\n"
                 + f"Initial model returned 404. Could not auto-discover a replacement model.\n\nRaw response: {debug_info}",
-                mimetype="text/plain",
-                status=500,
+                500,
+                {},
             )
 
-        retry_model_url = f"https://generativelanguage.googleapis.com/v1/models/{picked}:generateContent"
+        retry_model_url = f"{GEMINI_API_BASE}/models/{picked}:generateContent"
         time.sleep(0.5)
         resp2, status2 = call_generate(retry_model_url, GEMINI_API_KEY, payload)
 
@@ -373,63 +2097,455 @@ def trip_plan():
             try:
                 resp_json = resp2.json()
             except Exception as e:
-                return Response(
-                    base_text + f"[Error reading AI response after retry: {e}]",
-                    mimetype="text/plain",
-                    status=500,
-                )
+                return base_text + f"[Error reading AI response after retry: {e}]", 500, {}
 
             if "candidates" not in resp_json:
-                return Response(
-                    base_text + "\n[Gemini error response after retry]\n" + str(resp_json),
-                    mimetype="text/plain",
-                    status=500,
-                )
+                return base_text + "\n[Gemini error response after retry]\n" + str(resp_json), 500, {}
 
             ai_text = ""
             try:
                 ai_text = resp_json["candidates"][0]["content"]["parts"][0].get("text", "")
             except Exception as e:
                 ai_text = f"[No valid AI text after retry. Error: {e}]"
+            else:
+                trip_plan_cache.put(plan_key["key"], ai_text, plan_request)
 
             final_text = base_text + ai_text
-            return Response(final_text, mimetype="text/plain")
+            return final_text, 200, {"X-Trip-Plan-Cache": "miss"}
 
         else:
-            return Response(
-                base_text + f"[Error calling AI on retry: {resp2}]",
-                mimetype="text/plain",
-                status=500,
+            return base_text + f"[Error calling AI on retry: {resp2}]", 500, {}
+
+    # ---------- Parse original response ----------
+    if isinstance(resp, requests.Response):
+        try:
+            resp_json = resp.json()
+        except Exception as e:
+            return base_text + f"[Error reading AI response: {e}]", 500, {}
+
+        if "candidates" not in resp_json:
+            return base_text + "\n[Gemini error response]\n" + str(resp_json), 500, {}
+
+        ai_text = ""
+        try:
+            ai_text = resp_json["candidates"][0]["content"]["parts"][0].get("text", "")
+        except Exception as e:
+            ai_text = f"[No valid AI text. Error: {e}]"
+        else:
+            trip_plan_cache.put(plan_key["key"], ai_text, plan_request)
+
+        final_text = base_text + ai_text
+        return final_text, 200, {"X-Trip-Plan-Cache": "miss"}
+
+    return base_text + f"[Error calling AI API: {resp}]", 500, {}
+
+
+@app.route("/trip-plan", methods=["GET", "POST"])
+def trip_plan():
+    # ---------- READ INPUT ----------
+    try:
+        data, source = get_request_payload()
+    except Exception as e:
+        return Response(
+            f"Error parsing request: {e}",
+            mimetype="text/plain",
+            status=400,
+        )
+
+    if source == "none":
+        txt = (
+            "This endpoint expects: mode, start_location, travel_location, days, budget "
+            "via JSON body, form-data, or query parameters."
+        )
+        return Response(txt, mimetype="text/plain", status=400)
+
+    # ---------- MODE CHECK ----------
+    if get_str_param(data, "mode") != "TRIP_PLAN":
+        return Response("Unsupported mode", mimetype="text/plain", status=400)
+
+    # ---------- BASIC VALIDATION ----------
+    params, error = read_trip_plan_input(data)
+    if error:
+        return Response(error, mimetype="text/plain", status=400)
+
+    text, status, headers = generate_trip_plan(params)
+    out = Response(text, mimetype="text/plain", status=status)
+    out.headers.update(headers)
+    return out
+
+
+# ===================== /trip-plan/jobs (asynchronous generation) =====================
+
+# Zoho/Deluge gives up long before a slow Gemini call returns, and its retry used to
+# start the generation again. Jobs return an id at once, run on a small per-worker
+# pool, persist the result in Postgres and optionally POST it to a callback URL.
+# Submitting the same inputs again attaches to the queued/running job, or to one that
+# finished within TRIP_PLAN_JOB_REUSE_SECONDS; every attached caller's callback_url
+# is called when the job finishes (right away if it already has).
+TRIP_PLAN_JOB_WORKERS = int(os.environ.get("TRIP_PLAN_JOB_WORKERS", 4))
+TRIP_PLAN_JOB_MAX_ATTEMPTS = int(os.environ.get("TRIP_PLAN_JOB_MAX_ATTEMPTS", 3))
+TRIP_PLAN_JOB_REUSE_SECONDS = int(os.environ.get("TRIP_PLAN_JOB_REUSE_SECONDS", 3600))
+# a queued/running job untouched this long lost its worker (restart / recycle) → re-run it;
+# every worker sweeps for such jobs every TRIP_PLAN_JOB_SWEEP_SECONDS (0 disables)
+TRIP_PLAN_JOB_STALE_SECONDS = int(os.environ.get("TRIP_PLAN_JOB_STALE_SECONDS", 180))
+TRIP_PLAN_JOB_SWEEP_SECONDS = int(os.environ.get("TRIP_PLAN_JOB_SWEEP_SECONDS", 60))
+# comma-separated hosts callbacks may go to; unset → callback_url is refused, so the
+# (unauthenticated) job API can't be used to make this server POST to internal addresses
+TRIP_PLAN_CALLBACK_HOSTS = {h.strip().lower() for h in os.environ.get("TRIP_PLAN_CALLBACK_HOSTS", "").split(",") if h.strip()}
+# when set, callbacks carry X-Signature: sha256=<hmac of the body>
+TRIP_PLAN_CALLBACK_SECRET = os.environ.get("TRIP_PLAN_CALLBACK_SECRET")
+# callbacks (with their retry back-off) run on their own pool so slow or unreachable
+# callback hosts never hold the job workers
+TRIP_PLAN_CALLBACK_WORKERS = int(os.environ.get("TRIP_PLAN_CALLBACK_WORKERS", 2))
+
+_trip_plan_job_executor = ThreadPoolExecutor(max_workers=TRIP_PLAN_JOB_WORKERS, thread_name_prefix="trip-plan-job")
+_trip_plan_callback_executor = ThreadPoolExecutor(
+    max_workers=TRIP_PLAN_CALLBACK_WORKERS, thread_name_prefix="trip-plan-callback"
+)
+
+_JOB_COLUMNS = "id, status, attempts, result_text, result_status, callback_status, created_at, finished_at"
+
+
+def _trip_plan_request_key(params: dict) -> str:
+    """Same inputs → same key (case / surrounding spaces don't matter)."""
+    return "|".join([params["start_location"].lower(), params["travel_location"].lower(),
+                     str(params["days"]), f"{params['budget']:g}"])
+
+
+def _job_to_dict(row) -> dict:
+    job = dict(zip([c.strip() for c in _JOB_COLUMNS.split(",")], row))
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "result": job["result_text"],
+        "result_status": job["result_status"],
+        "callback_status": job["callback_status"],
+        "created_at": job["created_at"].isoformat() if job["created_at"] else None,
+        "finished_at": job["finished_at"].isoformat() if job["finished_at"] else None,
+        "url": f"/trip-plan/jobs/{job['id']}",
+    }
+
+
+def _valid_callback_url(url: str) -> bool:
+    """Only http(s) URLs on a host listed in TRIP_PLAN_CALLBACK_HOSTS."""
+    try:
+        parsed = urllib.parse.urlparse(url)
+        hostname = parsed.hostname
+    except ValueError:
+        return False
+    if parsed.scheme not in ("http", "https") or not hostname:
+        return False
+    return hostname.lower() in TRIP_PLAN_CALLBACK_HOSTS
+
+
+def submit_trip_plan_job(params: dict, callback_url: str = None):
+    """Create a job, or attach to an equivalent one. Returns (job dict, attached)."""
+    request_key = _trip_plan_request_key(params)
+    with db_conn() as conn:
+        cur = conn.cursor()
+        for _ in range(2):  # second round only if another worker inserted between our two statements
+            cur.execute(
+                f"""
+                SELECT {_JOB_COLUMNS}
+                FROM trip_plan_jobs
+                WHERE request_key = %s
+                  AND (status IN ('queued', 'running')
+                       OR (status = 'succeeded' AND finished_at > NOW() - make_interval(secs => %s)))
+                ORDER BY created_at DESC
+                LIMIT 1;
+                """,
+                (request_key, TRIP_PLAN_JOB_REUSE_SECONDS),
+            )
+            row = cur.fetchone()
+            if row:
+                if callback_url:
+                    # The row lock orders this against the job's completion: either the
+                    # completion's RETURNING callbacks sees this URL, or we see it finished.
+                    cur.execute(
+                        """
+                        UPDATE trip_plan_jobs SET callbacks = callbacks || jsonb_build_object(%s::text, 'pending')
+                        WHERE id = %s
+                        RETURNING status;
+                        """,
+                        (callback_url, row[0]),
+                    )
+                    status = cur.fetchone()[0]
+                    conn.commit()
+                    if status not in ("queued", "running"):
+                        _trip_plan_callback_executor.submit(deliver_trip_plan_callback, row[0], callback_url)
+                cur.close()
+                return _job_to_dict(row), True
+
+            cur.execute(
+                f"""
+                INSERT INTO trip_plan_jobs (id, request_key, params, callback_url, callbacks)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (request_key) WHERE status IN ('queued', 'running') DO NOTHING
+                RETURNING {_JOB_COLUMNS};
+                """,
+                (uuid.uuid4().hex, request_key, json.dumps(params), callback_url,
+                 json.dumps({callback_url: "pending"} if callback_url else {})),
+            )
+            row = cur.fetchone()
+            conn.commit()
+            if row:
+                cur.close()
+                _trip_plan_job_executor.submit(run_trip_plan_job, row[0])
+                return _job_to_dict(row), False
+        cur.close()
+    raise RuntimeError("could not create or find the job")
+
+
+def get_trip_plan_job(job_id: str):
+    """Job dict or None. A job whose worker went away is picked up again here."""
+    with db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT {_JOB_COLUMNS} FROM trip_plan_jobs WHERE id = %s;", (job_id,))
+        row = cur.fetchone()
+        if row and row[1] in ("queued", "running"):
+            cur.execute(
+                f"""
+                UPDATE trip_plan_jobs SET status = 'queued', updated_at = NOW()
+                WHERE id = %s AND status IN ('queued', 'running')
+                  AND updated_at < NOW() - make_interval(secs => %s)
+                RETURNING {_JOB_COLUMNS};
+                """,
+                (job_id, TRIP_PLAN_JOB_STALE_SECONDS),
+            )
+            reclaimed = cur.fetchone()
+            conn.commit()
+            if reclaimed:
+                row = reclaimed
+                _trip_plan_job_executor.submit(run_trip_plan_job, job_id)
+        cur.close()
+    return _job_to_dict(row) if row else None
+
+
+def run_trip_plan_job(job_id: str):
+    """Background: claim the job, generate, store the result, then queue the callbacks."""
+    try:
+        with db_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                UPDATE trip_plan_jobs
+                SET status = 'running', attempts = attempts + 1, updated_at = NOW()
+                WHERE id = %s AND status = 'queued'
+                RETURNING params, attempts;
+                """,
+                (job_id,),
+            )
+            claimed = cur.fetchone()
+            conn.commit()
+            cur.close()
+        if not claimed:
+            return  # someone else has it, or it's done
+        params, attempts = claimed
+
+        text, status, _ = generate_trip_plan(params)
+
+        retry = status >= 500 and attempts < TRIP_PLAN_JOB_MAX_ATTEMPTS
+        with db_conn() as conn:
+            cur = conn.cursor()
+            if retry:
+                cur.execute(
+                    "UPDATE trip_plan_jobs SET status = 'queued', result_text = %s, result_status = %s, "
+                    "updated_at = NOW() WHERE id = %s;",
+                    (text, status, job_id),
+                )
+            else:
+                cur.execute(
+                    """
+                    UPDATE trip_plan_jobs
+                    SET status = %s, result_text = %s, result_status = %s, updated_at = NOW(), finished_at = NOW()
+                    WHERE id = %s
+                    RETURNING callbacks;
+                    """,
+                    ("succeeded" if status < 400 else "failed", text, status, job_id),
+                )
+                callbacks = cur.fetchone()[0] or {}
+            conn.commit()
+            cur.close()
+    except Exception as e:
+        print("TRIP PLAN JOB ERROR:", job_id, e)
+        return  # left queued/running → picked up again once stale
+
+    if retry:
+        # back off (2 s, 4 s, ...) without holding a pool thread
+        timer = threading.Timer(2 ** attempts, _trip_plan_job_executor.submit, (run_trip_plan_job, job_id))
+        timer.daemon = True
+        timer.start()
+    else:
+        for callback_url in callbacks:
+            _trip_plan_callback_executor.submit(deliver_trip_plan_callback, job_id, callback_url)
+
+
+def _callback_summary(callbacks: dict):
+    """callback_status for the job: the outcome itself for one callback, else counts."""
+    if not callbacks:
+        return None
+    if len(callbacks) == 1:
+        return next(iter(callbacks.values()))
+    delivered = sum(1 for outcome in callbacks.values() if outcome.startswith("delivered"))
+    pending = sum(1 for outcome in callbacks.values() if outcome == "pending")
+    summary = f"{delivered}/{len(callbacks)} delivered"
+    return f"{summary}, {pending} pending" if pending else summary
+
+
+def deliver_trip_plan_callback(job_id: str, callback_url: str):
+    """POST the finished job to its callback URL (3 tries); the outcome is stored on the job."""
+    job = get_trip_plan_job(job_id)
+    body = dumps_json(job)
+    headers = {"Content-Type": "application/json"}
+    if TRIP_PLAN_CALLBACK_SECRET:
+        digest = hmac.new(TRIP_PLAN_CALLBACK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        headers["X-Signature"] = f"sha256={digest}"
+
+    outcome = "failed"
+    for attempt in range(3):
+        try:
+            with observe_upstream("callback", "trip_plan_job") as span:
+                # no redirects: the allowlisted host must not bounce us somewhere else
+                r = get_http_session().post(callback_url, data=body, headers=headers, timeout=10,
+                                            allow_redirects=False)
+                if not r.ok:
+                    span["outcome"] = "error"
+            outcome = f"delivered (HTTP {r.status_code})" if r.ok else f"failed (HTTP {r.status_code})"
+            if r.ok or r.status_code < 500:
+                break
+        except Exception as e:
+            outcome = f"failed ({e.__class__.__name__})"
+        time.sleep(2 ** attempt)
+
+    try:
+        with db_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                UPDATE trip_plan_jobs SET callbacks = jsonb_set(callbacks, ARRAY[%s], to_jsonb(%s::text))
+                WHERE id = %s
+                RETURNING callbacks;
+                """,
+                (callback_url, outcome, job_id),
             )
+            row = cur.fetchone()
+            if row:
+                cur.execute(
+                    "UPDATE trip_plan_jobs SET callback_status = %s WHERE id = %s;",
+                    (_callback_summary(row[0]), job_id),
+                )
+            conn.commit()
+            cur.close()
+    except Exception as e:
+        print("TRIP PLAN CALLBACK STATUS ERROR:", job_id, e)
+
+
+def requeue_stale_trip_plan_jobs() -> list:
+    """Re-queue jobs whose worker went away (restart / recycle) and run them here; returns their ids."""
+    with db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE trip_plan_jobs SET status = 'queued', updated_at = NOW()
+            WHERE status IN ('queued', 'running')
+              AND updated_at < NOW() - make_interval(secs => %s)
+            RETURNING id;
+            """,
+            (TRIP_PLAN_JOB_STALE_SECONDS,),
+        )
+        job_ids = [r[0] for r in cur.fetchall()]
+        conn.commit()
+        cur.close()
+    for job_id in job_ids:
+        _trip_plan_job_executor.submit(run_trip_plan_job, job_id)
+    return job_ids
+
+
+_trip_plan_job_sweeper = None
+
+
+def _sweep_trip_plan_jobs():
+    while True:
+        # jittered so the workers' sweeps spread out; the UPDATE hands each job to one of them
+        time.sleep(TRIP_PLAN_JOB_SWEEP_SECONDS * random.uniform(0.8, 1.2))
+        try:
+            job_ids = requeue_stale_trip_plan_jobs()
+            if job_ids:
+                print("TRIP PLAN JOBS RE-QUEUED:", ", ".join(job_ids))
+        except Exception as e:
+            print("TRIP PLAN JOB SWEEP ERROR:", e)
+
+
+def start_trip_plan_job_sweeper():
+    """Start this worker's stale-job sweep thread once (no-op without DATABASE_URL)."""
+    global _trip_plan_job_sweeper
+    if not DATABASE_URL or TRIP_PLAN_JOB_SWEEP_SECONDS <= 0:
+        return
+    if _trip_plan_job_sweeper is None or not _trip_plan_job_sweeper.is_alive():
+        _trip_plan_job_sweeper = threading.Thread(target=_sweep_trip_plan_jobs, name="trip-plan-job-sweep", daemon=True)
+        _trip_plan_job_sweeper.start()
+
+
+@app.route("/trip-plan/jobs", methods=["POST"])
+def trip_plan_jobs_route():
+    """
+    Input (JSON or form): start_location, travel_location, days, budget
+      (same as /trip-plan; mode is optional) and optional callback_url.
+
+    Output (JSON, 202): {"id": "...", "status": "queued", "url": "/trip-plan/jobs/<id>", "attached": false, ...}
+    "attached": true means an equivalent job already existed and its id is returned;
+    a callback_url sent with it is still called once that job finishes.
+    """
+    try:
+        data = get_request_data()
+    except Exception as e:
+        return json_response({"status": "error", "message": f"Error parsing request: {e}"}, status=400)
+
+    if get_str_param(data, "mode") not in ("", "TRIP_PLAN"):
+        return json_response({"status": "error", "message": "Unsupported mode"}, status=400)
+    params, error = read_trip_plan_input(data)
+    if error:
+        return json_response({"status": "error", "message": error}, status=400)
+    callback_url = get_str_param(data, "callback_url") or None
+    if callback_url and not _valid_callback_url(callback_url):
+        message = ("callback_url not allowed" if TRIP_PLAN_CALLBACK_HOSTS
+                   else "Callbacks are disabled (TRIP_PLAN_CALLBACK_HOSTS not configured); poll the job url")
+        return json_response({"status": "error", "message": message}, status=400)
 
-    # ---------- Parse original response ----------
-    if isinstance(resp, requests.Response):
-        try:
-            resp_json = resp.json()
-        except Exception as e:
-            return Response(
-                base_text + f"[Error reading AI response: {e}]",
-                mimetype="text/plain",
-                status=500,
-            )
+    try:
+        job, attached = submit_trip_plan_job(params, callback_url)
+    except Exception as e:
+        print("TRIP PLAN JOB SUBMIT ERROR:", e)
+        return json_response({"status": "error", "message": str(e)}, status=500)
 
-        if "candidates" not in resp_json:
-            return Response(
-                base_text + "\n[Gemini error response]\n" + str(resp_json),
-                mimetype="text/plain",
-                status=500,
-            )
+    job["attached"] = attached
+    return json_response(job, status=200 if job["status"] in ("succeeded", "failed") else 202)
 
-        ai_text = ""
-        try:
-            ai_text = resp_json["candidates"][0]["content"]["parts"][0].get("text", "")
-        except Exception as e:
-            ai_text = f"[No valid AI text. Error: {e}]"
 
-        final_text = base_text + ai_text
-        return Response(final_text, mimetype="text/plain")
+@app.route("/trip-plan/jobs/<job_id>", methods=["GET"])
+def trip_plan_job_route(job_id):
+    """
+    Poll a job: 202 while queued/running, 200 once finished.
+    JSON by default; ?format=text answers with the plan text itself (like /trip-plan)
+    once the job is done.
+    """
+    try:
+        job = get_trip_plan_job(job_id)
+    except Exception as e:
+        print("TRIP PLAN JOB READ ERROR:", e)
+        return json_response({"status": "error", "message": str(e)}, status=500)
+    if job is None:
+        return json_response({"status": "error", "message": "Job not found"}, status=404)
 
-    return Response(base_text + f"[Error calling AI API: {resp}]", mimetype="text/plain", status=500)
+    done = job["status"] in ("succeeded", "failed")
+    if request.args.get("format") == "text" and done:
+        return Response(job["result"] or "", mimetype="text/plain", status=job["result_status"] or 500)
+    resp = json_response(job, status=200 if done else 202)
+    if not done:
+        resp.headers["Retry-After"] = "2"
+    resp.cache_control.no_store = True
+    return resp
 
 
 # ===================== /get-trip-plan (Google Sheet) =====================
@@ -446,12 +2562,7 @@ def get_trip_plan_route():
     Output: plain text -> Trip Plan (from Google Sheet)
     """
     try:
-        if request.is_json:
-            data = request.get_json(silent=True) or {}
-        elif request.form:
-            data = request.form.to_dict()
-        else:
-            data = {}
+        data = get_request_data(include_args=False)
     except Exception as e:
         return Response(
             f"Error parsing request body: {e}",
@@ -472,7 +2583,7 @@ def get_trip_plan_route():
         )
 
     try:
-        plan_text = find_trip_plan(start_loc, travel_loc, days, budget)
+        found = match_trip_plan(start_loc, travel_loc, days, budget)
     except Exception as e:
         return Response(
             f"[Error reading Google Sheet: {e}]",
@@ -480,10 +2591,267 @@ def get_trip_plan_route():
             mimetype="text/plain",
         )
 
-    if not plan_text:
-        plan_text = ""  # Deluge side la fallback handle panna
+    if not found:
+        resp = Response("", status=200, mimetype="text/plain")  # Deluge side la fallback handle panna
+        resp.headers["X-Trip-Plan-Match"] = "none"
+        return resp
+
+    resp = Response(found["plan"], status=200, mimetype="text/plain")
+    resp.headers.update(_trip_plan_match_headers(found["match"], found["score"], found["key"]))
+    if found["match"] == "near":
+        row = found["row"]
+        resp.headers["X-Trip-Plan-Matched-Row"] = header_safe(
+            f"{row['start_location']}|{row['travel_location']}|{row['days']}|{row['budget']}"
+        )
+    return resp
+
+
+# ===================== /quote (distance + travel cost) =====================
+
+# Prices a start → travel location pair the way the Bookings sheet columns do:
+#   Distance Km            – great-circle km between the two places × QUOTE_ROAD_FACTOR
+#                            (1.0 = straight line), doubled for round trips
+#   Travel Cost 20/km      – distance × QUOTE_RATE_PER_KM
+#   Total Travel Allowance – budget (parsed like /trip-plan) + travel cost
+# Coordinates come from the bundled table in QUOTE_CITIES_FILE (name, state, lat, lon).
+# With numpy installed the city-to-city distances are one precomputed N×N matrix and a
+# whole batch is a single indexed lookup; without it each pair is computed with math.
+QUOTE_CITIES_FILE = os.environ.get(
+    "QUOTE_CITIES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "india_cities.csv")
+)
+QUOTE_RATE_PER_KM = float(os.environ.get("QUOTE_RATE_PER_KM", 20))
+QUOTE_ROAD_FACTOR = float(os.environ.get("QUOTE_ROAD_FACTOR", 1.0))
+QUOTE_MAX_PAIRS = int(os.environ.get("QUOTE_MAX_PAIRS", 1000))
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _haversine_km(lat1, lon1, lat2, lon2) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _haversine_km_np(lat1, lon1, lat2, lon2):
+    """_haversine_km elementwise over numpy arrays (broadcasts, so [:, None] vs [None, :] gives a matrix)."""
+    lat1, lon1, lat2, lon2 = (numpy.radians(x) for x in (lat1, lon1, lat2, lon2))
+    a = numpy.sin((lat2 - lat1) / 2) ** 2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+
+
+class CityDistances:
+    """
+    The bundled coordinate table, indexed by its own names plus the PLACE_ALIASES
+    aliases of those names, so "Bengaluru" / "Bangalore, India" find the same row.
+    Kept apart from place_normalizer: table names must not change trip plan keys.
+    Loaded on first use. distances() takes pairs whose ends are table indexes or
+    (lat, lon) tuples.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.cities = []  # [{"name", "state", "lat", "lon"}]
+        self.index = {}   # cleaned name / alias → position in cities
+        self._matrix = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._loaded:
+            return self
+        with self._lock:
+            if self._loaded:
+                return self
+            with open(self.path, newline="", encoding="utf-8") as f:
+                cities = [
+                    {"name": r["name"].strip(), "state": r["state"].strip(), "lat": float(r["lat"]), "lon": float(r["lon"])}
+                    for r in csv.DictReader(f)
+                ]
+            index = {}
+            for i, city in enumerate(cities):
+                index.setdefault(" ".join(_place_segments(city["name"])), i)
+            for canon, aliases in PLACE_ALIASES.items():
+                row = next((index[n] for n in [canon, *aliases] if n in index), None)
+                if row is not None:
+                    for name in [canon, *aliases]:
+                        index.setdefault(name, row)
+            if numpy is not None:
+                lat = numpy.array([c["lat"] for c in cities], dtype=float)
+                lon = numpy.array([c["lon"] for c in cities], dtype=float)
+                self._matrix = _haversine_km_np(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+            self.cities, self.index = cities, index
+            self._loaded = True
+        return self
+
+    def locate(self, place):
+        """
+        (name, index, score). Only exact / alias matches (score 1.0) get an index;
+        otherwise index is None and name / score are the closest table entry, for
+        the caller to suggest ("", 0.0 when nothing is close).
+        """
+        self.load()
+        segments = _place_segments(place)
+        if not segments:
+            return "", None, 0.0
+        stripped = [" ".join(w for w in seg.split() if w not in _PLACE_NOISE_WORDS) for seg in segments]
+        for candidate in [" ".join(segments)] + segments + stripped:
+            if candidate in self.index:
+                return self.cities[self.index[candidate]]["name"], self.index[candidate], 1.0
+
+        target = stripped[0] or segments[0]
+        best, best_score = "", 0.0
+        for name, i in self.index.items():
+            score = _similarity(target, name)
+            if score > best_score:
+                best, best_score = self.cities[i]["name"], score
+        return best, None, round(best_score, 3)
+
+    def _coords(self, end):
+        if isinstance(end, int):
+            city = self.cities[end]
+            return city["lat"], city["lon"]
+        return end
+
+    def distances(self, pairs) -> list:
+        """
+        Great-circle km for each (a, b). Table-to-table pairs are read from the
+        precomputed matrix; pairs with explicit coordinates are computed together
+        as one vectorized batch.
+        """
+        self.load()
+        if numpy is None or not pairs:
+            return [_haversine_km(*self._coords(a), *self._coords(b)) for a, b in pairs]
+
+        known, other = [], []
+        for i, (a, b) in enumerate(pairs):
+            (known if isinstance(a, int) and isinstance(b, int) else other).append(i)
+        out = numpy.empty(len(pairs))
+        if known:
+            rows = numpy.array([pairs[i][0] for i in known])
+            cols = numpy.array([pairs[i][1] for i in known])
+            out[known] = self._matrix[rows, cols]
+        if other:
+            coords = numpy.array([self._coords(pairs[i][0]) + self._coords(pairs[i][1]) for i in other], dtype=float)
+            out[other] = _haversine_km_np(coords[:, 0], coords[:, 1], coords[:, 2], coords[:, 3])
+        return out.tolist()
+
+    def stats(self) -> dict:
+        return {"cities": len(self.cities), "loaded": self._loaded, "matrix": self._matrix is not None}
+
+
+city_distances = CityDistances(QUOTE_CITIES_FILE)
+
+
+def _coord_param(item: dict, prefix: str):
+    """(lat, lon) from item["<prefix>_lat"] / item["<prefix>_lon"], or None when missing / out of range."""
+    try:
+        lat, lon = float(item[f"{prefix}_lat"]), float(item[f"{prefix}_lon"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+
+def quote_trips(items: list) -> list:
+    """
+    Price each item {start_location, travel_location, budget?, days?, round_trip?}.
+    Only exact / alias table matches are priced – a near miss ("Nagaur" ~ Nagpur)
+    is reported with its score, never priced as the neighbour. Places not in the
+    coordinate table may be given as start_lat / start_lon / travel_lat / travel_lon.
+    Returns one dict per item, in order; items that can't be priced carry "error"
+    instead of the amounts.
+    """
+    results, pairs, priced = [], [], []
+    for item in items:
+        if not isinstance(item, dict):
+            results.append({"error": "Each pair must be an object."})
+            continue
+        result = {
+            "start_location": get_str_param(item, "start_location"),
+            "travel_location": get_str_param(item, "travel_location"),
+        }
+        results.append(result)
+        if not result["start_location"] or not result["travel_location"]:
+            result["error"] = "start_location and travel_location are required."
+            continue
+
+        ends, missing = [], []
+        for prefix in ("start", "travel"):
+            place = result[f"{prefix}_location"]
+            name, idx, score = city_distances.locate(place)
+            result[f"{prefix}_score"] = score
+            if idx is not None:
+                result[prefix] = name
+                ends.append(idx)
+                continue
+            end = _coord_param(item, prefix)
+            if end is None:
+                missing.append(f"{place} (closest: {name}, score {score})" if name else place)
+            result[prefix] = None
+            ends.append(end)
+        if missing:
+            result["error"] = "Unknown location: " + ", ".join(missing) + " – send <start|travel>_lat / _lon."
+            continue
+        pairs.append(tuple(ends))
+        priced.append((result, item))
+
+    for km, (result, item) in zip(city_distances.distances(pairs), priced):
+        round_trip = str(item.get("round_trip", "")).strip().lower() in ("1", "true", "yes")
+        distance = round(km * QUOTE_ROAD_FACTOR * (2 if round_trip else 1), 1)
+        budget = parse_budget(item.get("budget", ""))
+        travel_cost = int(round(distance * QUOTE_RATE_PER_KM))
+        result.update({
+            "round_trip": round_trip,
+            "distance_km": distance,
+            "rate_per_km": QUOTE_RATE_PER_KM,
+            "travel_cost": travel_cost,
+            "budget": int(round(budget)),
+            "total_travel_allowance": int(round(budget + travel_cost)),
+        })
+        days = parse_int_param(item.get("days", 0))
+        if days > 0:
+            result["days"] = days
+            result["budget_per_day"] = int(round(budget / days))
+    return results
+
+
+@app.route("/quote", methods=["GET", "POST"])
+def quote_route():
+    """
+    Input (JSON, form or query string), one pair:
+      - start_location, travel_location
+      - budget (optional, "5000" / "3000 - 6000"), days (optional), round_trip (optional)
+      - start_lat / start_lon / travel_lat / travel_lon for places not in the table
+    or a batch (JSON): {"pairs": [{...}, ...]} with up to QUOTE_MAX_PAIRS items.
+
+    Output: the quote object ({"quotes": [...]} for a batch, each with "error" when
+    that pair couldn't be priced). start_score / travel_score are 1.0 for table
+    matches; a lower score is the closest table entry, which is not priced (400).
+    """
+    try:
+        data = get_request_data()
+    except Exception as e:
+        return json_response({"status": "error", "message": f"Error parsing request body: {e}"}, status=400)
+
+    try:
+        city_distances.load()
+    except (OSError, ValueError, KeyError) as e:
+        return json_response({"status": "error", "message": f"Coordinate table unavailable: {e}"}, status=500)
+
+    if "pairs" in data:
+        pairs = data["pairs"]
+        if not isinstance(pairs, list) or not pairs:
+            return json_response({"status": "error", "message": "pairs must be a non-empty list."}, status=400)
+        if len(pairs) > QUOTE_MAX_PAIRS:
+            return json_response({"status": "error", "message": f"At most {QUOTE_MAX_PAIRS} pairs per request."}, status=400)
+        return json_response({"status": "success", "quotes": quote_trips(pairs)})
 
-    return Response(plan_text, status=200, mimetype="text/plain")
+    quote = quote_trips([data])[0]
+    if "error" in quote:
+        message = quote.pop("error")
+        return json_response({"status": "error", "message": message, **quote}, status=400)
+    return json_response({"status": "success", **quote})
 
 
 # ===================== /get-bookings (Bookings for My Packages) =====================
@@ -512,45 +2880,28 @@ def get_bookings_route():
     This matches the structure expected by the Zoho 'my_packages' handler.
     """
     try:
-        if request.is_json:
-            data = request.get_json(silent=True) or {}
-        elif request.form:
-            data = request.form.to_dict()
-        elif request.args:
-            data = request.args.to_dict()
-        else:
-            data = {}
+        data = get_request_data()
     except Exception as e:
-        return Response(
-            json.dumps({"error": f"Error parsing request body: {e}"}),
-            status=400,
-            mimetype="application/json",
-        )
+        return json_response({"error": f"Error parsing request body: {e}"}, status=400)
 
     email = (data.get("email") or "").strip()
     if not email:
-        return Response(
-            json.dumps({"error": "Missing parameter: email"}),
-            status=400,
-            mimetype="application/json",
-        )
+        return json_response({"error": "Missing parameter: email"}, status=400)
 
     try:
         bookings = get_bookings_for_email(email)
     except Exception as e:
-        return Response(
-            json.dumps({"error": f"Error reading bookings: {e}"}),
-            status=500,
-            mimetype="application/json",
-        )
+        return json_response({"error": f"Error reading bookings: {e}"}, status=500)
 
     resp = {"bookings": bookings}
-    return Response(json.dumps(resp), status=200, mimetype="application/json")
+    return json_response(resp, status=200)
 
 
-def get_bookings_for_email(email: str):
+class BookingIndex:
     """
-    Read active bookings for the given email from the Bookings sheet.
+    Active bookings from the Bookings sheet grouped by lowercased email, latest
+    first (closed / cancelled rows skipped). Built once per sheet snapshot, so any
+    number of lookups cost one read and one scan.
 
     Expected columns in 'BOOKINGS_SHEET_NAME' sheet header row:
 
@@ -576,79 +2927,161 @@ def get_bookings_for_email(email: str):
       T: Total Travel Allowance
       U: Trip Plan
     """
+
+    def __init__(self, rows):
+        self.by_email = {}
+        if len(rows) < 2:
+            return
+
+        header = rows[0]
+        data_rows = rows[1:]
+
+        # find column indexes by header name (case-insensitive)
+        def find_col(name, default_index=None):
+            low = name.lower()
+            for idx, h in enumerate(header):
+                if str(h).strip().lower() == low:
+                    return idx
+            return default_index
+
+        TS_COL          = find_col("Timestamp", 0)
+        EMAIL_COL       = find_col("Email", 6)
+        PKG_TITLE_COL   = find_col("Package Title", 3)
+        TRAVEL_DATE_COL = find_col("Travel Date", 8)
+        MEMBERS_COL     = find_col("Members", 9)
+        STATUS_COL      = find_col("Status", 12)
+        BOOKING_ID_COL  = find_col("Booking ID", 1)
+        TRAVEL_LOC_COL  = find_col("Travel Location", 14)
+        START_LOC_COL   = find_col("Start Location", 13)
+
+        # read from latest to oldest
+        for r in reversed(data_rows):
+            if len(r) <= EMAIL_COL:
+                continue
+
+            row_email = str(r[EMAIL_COL] or "").strip().lower()
+            if not row_email:
+                continue
+
+            status = ""
+            if len(r) > STATUS_COL:
+                status = str(r[STATUS_COL] or "").strip().lower()
+
+            # skip closed / cancelled
+            if status in ("closed", "cancelled", "canceled"):
+                continue
+
+            pkg_title   = r[PKG_TITLE_COL] if len(r) > PKG_TITLE_COL else ""
+            booking_id  = r[BOOKING_ID_COL] if len(r) > BOOKING_ID_COL else ""
+            travel_date = r[TRAVEL_DATE_COL] if len(r) > TRAVEL_DATE_COL else ""
+            members     = r[MEMBERS_COL] if len(r) > MEMBERS_COL else ""
+            ts          = r[TS_COL] if len(r) > TS_COL else ""
+            travel_loc  = r[TRAVEL_LOC_COL] if len(r) > TRAVEL_LOC_COL else ""
+            start_loc   = r[START_LOC_COL] if len(r) > START_LOC_COL else ""
+
+            # "place" field for Zoho: prefer travel location; fallback to start; else package
+            place = travel_loc or start_loc or pkg_title
+
+            self.by_email.setdefault(row_email, []).append({
+                "package": pkg_title or "Your Package",
+                "booking_id": booking_id,
+                "place": place,
+                "travel_date": travel_date,
+                "members": members,
+                "timestamp": ts,
+            })
+
+    def lookup(self, email: str) -> list:
+        return list(self.by_email.get((email or "").strip().lower(), ()))
+
+
+_booking_index = (None, None)  # (snapshot rows it was built from, BookingIndex)
+
+
+def get_booking_index() -> BookingIndex:
+    global _booking_index
+    rows = get_sheet_rows(BOOKINGS_SHEET_NAME)
+    built_from, index = _booking_index
+    if built_from is not rows:
+        index = BookingIndex(rows)
+        _booking_index = (rows, index)
+    return index
+
+
+def get_bookings_for_email(email: str):
+    """Active bookings for the given email, latest first (see BookingIndex)."""
     if not email:
         return []
+    return get_booking_index().lookup(email)
 
-    client = get_gspread_client()
-    sh = client.open_by_key(GOOGLE_SHEET_ID)
-    ws = sh.worksheet("Bookings")
 
-    rows = ws.get_all_values()
-    if len(rows) < 2:
+# ===================== /get-bookings/batch (NDJSON, CRM sync) =====================
+
+# One sheet read answers every email in the request; results stream back as one
+# NDJSON line per requested email, in request order (duplicates collapsed):
+#   {"email": "a@example.com", "bookings": [...same objects as /get-bookings...]}
+BOOKINGS_BATCH_MAX_EMAILS = int(os.environ.get("BOOKINGS_BATCH_MAX_EMAILS", 10000))
+BOOKINGS_BATCH_CHUNK_BYTES = 64 * 1024
+
+
+def _batch_emails(value) -> list:
+    """Lowercased, de-duplicated emails from a JSON list or a comma / newline separated string."""
+    if isinstance(value, str):
+        value = re.split(r"[,\s]+", value)
+    if not isinstance(value, list):
         return []
+    seen = {}
+    for email in value:
+        email = str(email or "").strip().lower()
+        if email:
+            seen.setdefault(email, None)
+    return list(seen)
 
-    header = rows[0]
-    data_rows = rows[1:]
 
-    # find column indexes by header name (case-insensitive)
-    def find_col(name, default_index=None):
-        low = name.lower()
-        for idx, h in enumerate(header):
-            if str(h).strip().lower() == low:
-                return idx
-        return default_index
-
-    TS_COL          = find_col("Timestamp", 0)
-    EMAIL_COL       = find_col("Email", 6)
-    PKG_TITLE_COL   = find_col("Package Title", 3)
-    TRAVEL_DATE_COL = find_col("Travel Date", 8)
-    MEMBERS_COL     = find_col("Members", 9)
-    STATUS_COL      = find_col("Status", 12)
-    BOOKING_ID_COL  = find_col("Booking ID", 1)
-    TRAVEL_LOC_COL  = find_col("Travel Location", 14)
-    START_LOC_COL   = find_col("Start Location", 13)
-
-    email_norm = (email or "").strip().lower()
-    bookings = []
-
-    # read from latest to oldest
-    for r in reversed(data_rows):
-        if len(r) <= EMAIL_COL:
-            continue
+@app.route("/get-bookings/batch", methods=["POST"])
+def get_bookings_batch_route():
+    """
+    Admin (X-Admin-Token). Input (JSON or form):
+      - emails: ["a@example.com", ...] or "a@example.com, b@example.com"
 
-        row_email = str(r[EMAIL_COL] or "").strip().lower()
-        if row_email != email_norm:
-            continue
+    Output: application/x-ndjson, one {"email", "bookings"} line per email
+    (an empty list when the email has no active bookings).
+    """
+    if not _admin_authorized():
+        return json_response({"status": "error", "message": "Forbidden"}, status=403)
 
-        status = ""
-        if len(r) > STATUS_COL:
-            status = str(r[STATUS_COL] or "").strip().lower()
+    try:
+        data = get_request_data(include_args=False)
+    except Exception as e:
+        return json_response({"error": f"Error parsing request body: {e}"}, status=400)
 
-        # skip closed / cancelled
-        if status in ("closed", "cancelled", "canceled"):
-            continue
+    emails = _batch_emails(data.get("emails"))
+    if not emails:
+        return json_response({"error": "Missing parameter: emails"}, status=400)
+    if len(emails) > BOOKINGS_BATCH_MAX_EMAILS:
+        return json_response({"error": f"At most {BOOKINGS_BATCH_MAX_EMAILS} emails per request."}, status=400)
 
-        pkg_title   = r[PKG_TITLE_COL] if len(r) > PKG_TITLE_COL else ""
-        booking_id  = r[BOOKING_ID_COL] if len(r) > BOOKING_ID_COL else ""
-        travel_date = r[TRAVEL_DATE_COL] if len(r) > TRAVEL_DATE_COL else ""
-        members     = r[MEMBERS_COL] if len(r) > MEMBERS_COL else ""
-        ts          = r[TS_COL] if len(r) > TS_COL else ""
-        travel_loc  = r[TRAVEL_LOC_COL] if len(r) > TRAVEL_LOC_COL else ""
-        start_loc   = r[START_LOC_COL] if len(r) > START_LOC_COL else ""
-
-        # "place" field for Zoho: prefer travel location; fallback to start; else package
-        place = travel_loc or start_loc or pkg_title
-
-        bookings.append({
-            "package": pkg_title or "Your Package",
-            "booking_id": booking_id,
-            "place": place,
-            "travel_date": travel_date,
-            "members": members,
-            "timestamp": ts,
-        })
+    # read the sheet before streaming so failures still get a proper status code
+    try:
+        index = get_booking_index()
+    except Exception as e:
+        return json_response({"error": f"Error reading bookings: {e}"}, status=500)
 
-    return bookings
+    def generate():
+        chunk, size = [], 0
+        for email in emails:
+            line = dumps_json({"email": email, "bookings": index.lookup(email)}) + b"\n"
+            chunk.append(line)
+            size += len(line)
+            if size >= BOOKINGS_BATCH_CHUNK_BYTES:
+                yield b"".join(chunk)
+                chunk, size = [], 0
+        if chunk:
+            yield b"".join(chunk)
+
+    resp = Response(generate(), status=200, mimetype="application/x-ndjson")
+    resp.headers["X-Bookings-Emails"] = str(len(emails))
+    return resp
 
 
 # ===================== OTP HELPERS =====================
@@ -656,12 +3089,13 @@ def get_bookings_for_email(email: str):
 def _cleanup_expired_otps():
     """Remove expired OTP entries from otp_store."""
     now = int(time.time())
-    expired_keys = []
-    for email_key, info in otp_store.items():
-        if info.get("expires_at", 0) < now:
-            expired_keys.append(email_key)
-    for k in expired_keys:
-        otp_store.pop(k, None)
+    with _otp_lock:
+        expired_keys = []
+        for email_key, info in otp_store.items():
+            if info.get("expires_at", 0) < now:
+                expired_keys.append(email_key)
+        for k in expired_keys:
+            otp_store.pop(k, None)
 
 
 def _generate_otp_code(length: int = 6) -> str:
@@ -683,10 +3117,11 @@ def set_otp_for_email(email: str) -> str:
     otp = _generate_otp_code(6)
     expires_at = int(time.time()) + OTP_TTL_SECONDS
 
-    otp_store[email_key] = {
-        "otp": otp,
-        "expires_at": expires_at,
-    }
+    with _otp_lock:
+        otp_store[email_key] = {
+            "otp": otp,
+            "expires_at": expires_at,
+        }
     return otp
 
 
@@ -700,20 +3135,22 @@ def verify_otp_for_email(email: str, otp: str) -> bool:
 
     _cleanup_expired_otps()
 
-    info = otp_store.get(email_key)
-    if not info:
-        return False
+    # check + delete atomically, so one OTP can't be redeemed twice by parallel requests
+    with _otp_lock:
+        info = otp_store.get(email_key)
+        if not info:
+            return False
 
-    if info.get("otp") != otp:
-        return False
+        if info.get("otp") != otp:
+            return False
 
-    if info.get("expires_at", 0) < int(time.time()):
-        otp_store.pop(email_key, None)
-        return False
+        if info.get("expires_at", 0) < int(time.time()):
+            otp_store.pop(email_key, None)
+            return False
 
-    # OTP valid → one-time use: delete entry
-    otp_store.pop(email_key, None)
-    return True
+        # OTP valid → one-time use: delete entry
+        otp_store.pop(email_key, None)
+        return True
 
 
 # ===================== /generate-otp =====================
@@ -726,40 +3163,21 @@ def generate_otp_route():
       - GET : /generate-otp?email=...
     """
     try:
-        if request.is_json:
-            data = request.get_json(silent=True) or {}
-        elif request.form:
-            data = request.form.to_dict()
-        elif request.args:
-            data = request.args.to_dict()
-        else:
-            data = {}
+        data = get_request_data()
     except Exception as e:
-        return Response(
-            json.dumps({"status": "error", "message": f"Error parsing request body: {e}"}),
-            status=400,
-            mimetype="application/json",
-        )
+        return json_response({"status": "error", "message": f"Error parsing request body: {e}"}, status=400)
 
     email = (data.get("email") or "").strip()
     if not email:
-        return Response(
-            json.dumps({"status": "error", "message": "Missing parameter: email"}),
-            status=400,
-            mimetype="application/json",
-        )
+        return json_response({"status": "error", "message": "Missing parameter: email"}, status=400)
 
     try:
         otp = set_otp_for_email(email)
     except Exception as e:
-        return Response(
-            json.dumps({"status": "error", "message": f"Could not generate OTP: {e}"}),
-            status=500,
-            mimetype="application/json",
-        )
+        return json_response({"status": "error", "message": f"Could not generate OTP: {e}"}, status=500)
 
     resp = {"status": "success", "otp": otp}
-    return Response(json.dumps(resp), status=200, mimetype="application/json")
+    return json_response(resp, status=200)
 
 
 # ===================== /verify-otp =====================
@@ -772,29 +3190,17 @@ def verify_otp_route():
       - GET : /verify-otp?email=...&otp=...
     """
     try:
-        if request.is_json:
-            data = request.get_json(silent=True) or {}
-        elif request.form:
-            data = request.form.to_dict()
-        elif request.args:
-            data = request.args.to_dict()
-        else:
-            data = {}
+        data = get_request_data()
     except Exception as e:
-        return Response(
-            json.dumps({"status": "error", "message": f"Error parsing request body: {e}"}),
-            status=400,
-            mimetype="application/json",
-        )
+        return json_response({"status": "error", "message": f"Error parsing request body: {e}"}, status=400)
 
     email = (data.get("email") or "").strip()
     otp = (data.get("otp") or "").strip()
 
     if not email or not otp:
-        return Response(
-            json.dumps({"status": "error", "message": "Missing parameters: email and/or otp"}),
+        return json_response(
+            {"status": "error", "message": "Missing parameters: email and/or otp"},
             status=400,
-            mimetype="application/json",
         )
 
     ok = verify_otp_for_email(email, otp)
@@ -804,7 +3210,7 @@ def verify_otp_route():
     else:
         resp = {"status": "failed"}
 
-    return Response(json.dumps(resp), status=200, mimetype="application/json")
+    return json_response(resp, status=200)
 
 
 # ===================== CLOSE BOOKING HELPERS =====================
@@ -826,17 +3232,18 @@ def close_booking_in_sheets(booking_id: str) -> (bool, str):
     if not booking_id:
         return False, "Booking ID required"
 
-    client = get_gspread_client()
-    sh = client.open_by_key(GOOGLE_SHEET_ID)
+    sh = get_spreadsheet()
 
     # main bookings sheet
     try:
-        booking_ws = sh.worksheet("Bookings")
+        with observe_upstream("sheets", "worksheet"):
+            booking_ws = sh.worksheet(BOOKINGS_SHEET_NAME)
     except Exception:
         return False, "Bookings sheet not found"
 
     # all rows
-    rows = booking_ws.get_all_values()
+    with observe_upstream("sheets", "get_all_values"):
+        rows = booking_ws.get_all_values()
     if len(rows) < 2:
         return False, "No bookings found"
 
@@ -855,10 +3262,13 @@ def close_booking_in_sheets(booking_id: str) -> (bool, str):
 
     # ClosedBookings sheet – create if not exists
     try:
-        closed_ws = sh.worksheet("ClosedBookings")
+        with observe_upstream("sheets", "worksheet"):
+            closed_ws = sh.worksheet("ClosedBookings")
     except Exception:
-        closed_ws = sh.add_worksheet(title="ClosedBookings", rows="1000", cols=str(len(header)))
-        closed_ws.append_row(header)
+        with observe_upstream("sheets", "add_worksheet"):
+            closed_ws = sh.add_worksheet(title="ClosedBookings", rows="1000", cols=str(len(header)))
+        with observe_upstream("sheets", "append_row"):
+            closed_ws.append_row(header)
 
     # search row
     target_row_index = None   # 1-based row number in sheet
@@ -878,68 +3288,556 @@ def close_booking_in_sheets(booking_id: str) -> (bool, str):
 
     # append to ClosedBookings and delete from Bookings
     try:
-        closed_ws.append_row(target_row_values)
-        booking_ws.delete_rows(target_row_index)
+        with observe_upstream("sheets", "append_row"):
+            closed_ws.append_row(target_row_values)
+        with observe_upstream("sheets", "delete_rows"):
+            booking_ws.delete_rows(target_row_index)
     except Exception as e:
         return False, f"Error while moving booking: {e}"
+    finally:
+        # the sheet may have changed (even on partial failure) → next read goes to Sheets,
+        # here and in every other worker / instance
+        sheet_cache.invalidate(BOOKINGS_SHEET_NAME)
+        try:
+            publish_sheet_change({"sheet": BOOKINGS_SHEET_NAME, "action": "invalidate"})
+        except Exception as e:
+            print("SHEET CHANGE PUBLISH ERROR:", e)
 
     return True, f"Booking closed and moved: {booking_id}"
 
 
-# ===================== /close-booking (JSON API) =====================
+# ===================== /close-booking (JSON API) =====================
+
+@app.route("/close-booking", methods=["GET", "POST"])
+def close_booking_route():
+    """
+    Close single booking and move it to ClosedBookings sheet.
+
+    Input (JSON, form or query):
+      - booking_id
+
+    Output (JSON):
+    {
+      "status": "success" | "error",
+      "message": "..."
+    }
+    """
+    # ---- read input ----
+    try:
+        data = get_request_data()
+    except Exception as e:
+        return json_response({"status": "error", "message": f"Error parsing request body: {e}"}, status=400)
+
+    booking_id = (data.get("booking_id") or "").strip()
+
+    if not booking_id:
+        return json_response({"status": "error", "message": "Missing parameter: booking_id"}, status=400)
+
+    try:
+        ok, msg = close_booking_in_sheets(booking_id)
+    except Exception as e:
+        ok = False
+        msg = f"Unexpected error while closing booking: {e}"
+
+    status = "success" if ok else "error"
+    return json_response({"status": status, "message": msg}, status=200)
+
+
+# ===================== IMAGE STORAGE (content-addressed, deduplicated) =====================
+
+UPLOAD_READ_CHUNK = 64 * 1024
+# Each uploaded file part is kept in memory up to this size, then spilled to a temp file.
+UPLOAD_SPOOL_MAX_MEMORY = int(os.environ.get("UPLOAD_SPOOL_MAX_MEMORY", 1024 * 1024))
+
+
+class SpooledUploadRequest(Request):
+    """Request whose multipart file parts stream into per-file spooled temp files."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY, mode="w+b")
+
+
+app.request_class = SpooledUploadRequest
+
+
+def read_upload(file):
+    """
+    Read an uploaded file in chunks, hashing as we go.
+    Returns (data, sha256_hex).
+    """
+    h = hashlib.sha256()
+    chunks = []
+    while True:
+        chunk = file.stream.read(UPLOAD_READ_CHUNK)
+        if not chunk:
+            break
+        h.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), h.hexdigest()
+
+
+class PostgresBlobStore:
+    """Blob bytes kept inline in image_blobs.data (BYTEA)."""
+
+    name = "postgres"
+
+    def column_value(self, sha256: str, data: bytes):
+        return psycopg2.Binary(data)
+
+    def write(self, cur, sha256: str, data: bytes):
+        cur.execute(
+            "UPDATE image_blobs SET storage = %s, data = %s WHERE sha256 = %s;",
+            (self.name, psycopg2.Binary(data), sha256),
+        )
+
+    def read(self, cur, sha256: str):
+        cur.execute("SELECT data FROM image_blobs WHERE sha256 = %s;", (sha256,))
+        row = cur.fetchone()
+        return bytes(row[0]) if row and row[0] is not None else None
+
+    def remove(self, sha256: str):
+        pass  # the bytes go away with the column value
+
+
+class FilesystemBlobStore:
+    """
+    Blob bytes kept on local / mounted disk, sharded by content hash:
+
+        <root>/ab/cd/abcd1234...
+
+    Postgres only keeps the metadata row (data = NULL). Files are immutable
+    and written atomically, so concurrent readers never see a partial blob.
+    """
+
+    name = "filesystem"
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def column_value(self, sha256: str, data: bytes):
+        self.put_file(sha256, data)
+        return None
+
+    def put_file(self, sha256: str, data: bytes):
+        dest = self.path(sha256)
+        if os.path.exists(dest):
+            return dest  # content-addressed → already there
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, dest)
+        return dest
+
+    def put_stream(self, sha256: str, stream):
+        """Like put_file(), but copies from a file object without loading it into memory."""
+        dest = self.path(sha256)
+        if os.path.exists(dest):
+            return dest
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(stream, f, UPLOAD_READ_CHUNK)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, dest)
+        return dest
+
+    def write(self, cur, sha256: str, data: bytes):
+        self.put_file(sha256, data)
+        cur.execute(
+            "UPDATE image_blobs SET storage = %s, data = NULL WHERE sha256 = %s;",
+            (self.name, sha256),
+        )
+
+    def read(self, cur, sha256: str):
+        try:
+            with open(self.path(sha256), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def remove(self, sha256: str):
+        try:
+            os.remove(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+
+# Backend used for NEW uploads. Existing blobs stay where their `storage` column says
+# until moved with migrate_image_storage.py.
+IMAGE_STORAGE_BACKEND = os.environ.get("IMAGE_STORAGE_BACKEND", "postgres")
+IMAGE_STORAGE_DIR = os.environ.get("IMAGE_STORAGE_DIR", os.path.join(os.getcwd(), "image_store"))
+
+# Behind nginx/Apache, let the front server stream filesystem blobs (X-Sendfile).
+app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE", "").lower() in ("1", "true", "yes")
+
+blob_stores = {
+    PostgresBlobStore.name: PostgresBlobStore(),
+    FilesystemBlobStore.name: FilesystemBlobStore(IMAGE_STORAGE_DIR),
+}
+
+
+def get_blob_store(name: str = None):
+    name = name or IMAGE_STORAGE_BACKEND
+    if name not in blob_stores:
+        raise RuntimeError(f"Unknown image storage backend: {name}")
+    return blob_stores[name]
+
+
+def read_blob(cur, sha256: str):
+    """Bytes of a stored blob from whichever backend its row points at (None if missing)."""
+    cur.execute("SELECT storage FROM image_blobs WHERE sha256 = %s;", (sha256,))
+    row = cur.fetchone()
+    return get_blob_store(row[0]).read(cur, sha256) if row else None
+
+
+def save_uploaded_image(cur, filename: str, content_type: str, data: bytes, sha256: str):
+    """
+    Record one upload. The bytes are only stored if no blob with the same
+    content hash exists yet; otherwise the new id/filename row points at the
+    existing blob.
+
+    Returns (img_id, is_new_blob). Caller commits.
+    """
+    cur.execute("SELECT 1 FROM image_blobs WHERE sha256 = %s;", (sha256,))
+    is_new_blob = cur.fetchone() is None
+
+    if is_new_blob:
+        store = get_blob_store()
+        cur.execute(
+            """
+            INSERT INTO image_blobs (sha256, content_type, byte_size, storage, data)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (sha256) DO NOTHING
+            RETURNING sha256;
+            """,
+            (sha256, content_type, len(data), store.name, store.column_value(sha256, data)),
+        )
+        # lost a race with a concurrent upload of the same content → reuse it
+        is_new_blob = cur.fetchone() is not None
+
+    cur.execute(
+        """
+        INSERT INTO uploaded_images (filename, content_type, sha256)
+        VALUES (%s, %s, %s)
+        RETURNING id;
+        """,
+        (filename, content_type, sha256),
+    )
+    img_id = cur.fetchone()[0]
+    return img_id, is_new_blob
+
+
+def hash_upload(file):
+    """
+    Hash an uploaded file without keeping it in memory.
+    Returns (sha256_hex, byte_size) and rewinds the stream for the next reader.
+    """
+    h = hashlib.sha256()
+    size = 0
+    stream = file.stream
+    stream.seek(0)
+    while True:
+        chunk = stream.read(UPLOAD_READ_CHUNK)
+        if not chunk:
+            break
+        h.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return h.hexdigest(), size
+
+
+def _copy_text_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class _BlobCopyStream:
+    """
+    File-like object feeding COPY ... FROM STDIN (text format) one blob at a time.
+
+    Rows are `sha256 <TAB> content_type <TAB> byte_size <TAB> \\x<hex bytes>`; file
+    contents are hex-encoded chunk by chunk as psycopg2 asks for more, so a large
+    batch never has to be held in memory at once.
+    """
+
+    def __init__(self, blobs):
+        self._blobs = iter(blobs)  # (sha256, content_type, byte_size, stream)
+        self._stream = None
+        self._buf = b""
+
+    def _fill(self, size):
+        while len(self._buf) < size:
+            if self._stream is None:
+                nxt = next(self._blobs, None)
+                if nxt is None:
+                    return
+                sha256, content_type, byte_size, stream = nxt
+                stream.seek(0)
+                self._stream = stream
+                head = f"{sha256}\t{_copy_text_escape(content_type)}\t{byte_size}\t\\\\x"
+                self._buf += head.encode("utf-8")
+                continue
+            chunk = self._stream.read(UPLOAD_READ_CHUNK)
+            if chunk:
+                self._buf += chunk.hex().encode("ascii")
+            else:
+                self._stream.seek(0)
+                self._stream = None
+                self._buf += b"\n"
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = 1 << 62
+        self._fill(size)
+        out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+
+def save_uploaded_images_bulk(cur, uploads):
+    """
+    Record many uploads inside the caller's transaction.
+
+    `uploads` is a list of (filename, content_type, stream, sha256, byte_size) in upload
+    order. New content is written once per distinct hash (COPY into a temp staging
+    table for the postgres backend, streamed files for the filesystem backend); the
+    per-upload rows go in with a single INSERT ... SELECT FROM unnest(...) WITH ORDINALITY,
+    matched back to the uploads by ordinal.
+
+    Returns a list of (img_id, is_new_blob) in the same order. Caller commits.
+    """
+    hashes = list({u[3] for u in uploads})
+    cur.execute("SELECT sha256 FROM image_blobs WHERE sha256 = ANY(%s);", (hashes,))
+    existing = {r[0] for r in cur.fetchall()}
+
+    pending = {}
+    for filename, content_type, stream, sha256, byte_size in uploads:
+        if sha256 not in existing and sha256 not in pending:
+            pending[sha256] = (sha256, content_type, byte_size, stream)
+
+    created = set()
+    if pending:
+        store = get_blob_store()
+        if store.name == FilesystemBlobStore.name:
+            for sha256, content_type, byte_size, stream in pending.values():
+                stream.seek(0)
+                store.put_stream(sha256, stream)
+            rows = execute_values(
+                cur,
+                """
+                INSERT INTO image_blobs (sha256, content_type, byte_size, storage)
+                VALUES %s
+                ON CONFLICT (sha256) DO NOTHING
+                RETURNING sha256;
+                """,
+                [(sha, ctype, size, store.name) for sha, ctype, size, _ in pending.values()],
+                fetch=True,
+            )
+        else:
+            cur.execute(
+                """
+                CREATE TEMP TABLE IF NOT EXISTS image_blobs_stage (
+                    sha256 TEXT, content_type TEXT, byte_size INTEGER, data BYTEA
+                ) ON COMMIT DELETE ROWS;
+                """
+            )
+            cur.copy_expert(
+                "COPY image_blobs_stage (sha256, content_type, byte_size, data) FROM STDIN;",
+                _BlobCopyStream(pending.values()),
+            )
+            cur.execute(
+                """
+                INSERT INTO image_blobs (sha256, content_type, byte_size, storage, data)
+                SELECT sha256, content_type, byte_size, %s, data FROM image_blobs_stage
+                ON CONFLICT (sha256) DO NOTHING
+                RETURNING sha256;
+                """,
+                (store.name,),
+            )
+            rows = cur.fetchall()
+        created = {r[0] for r in rows}
+
+    # RETURNING order is not guaranteed, so each row carries its upload ordinal back
+    cur.execute(
+        """
+        WITH t AS (
+            SELECT nextval(pg_get_serial_sequence('uploaded_images', 'id')) AS id,
+                   filename, content_type, sha256, ord
+            FROM unnest(%s::text[], %s::text[], %s::text[])
+                 WITH ORDINALITY AS u(filename, content_type, sha256, ord)
+        ), ins AS (
+            INSERT INTO uploaded_images (id, filename, content_type, sha256)
+            SELECT id, filename, content_type, sha256 FROM t
+            RETURNING id
+        )
+        SELECT t.id, t.ord FROM ins JOIN t USING (id);
+        """,
+        ([u[0] for u in uploads], [u[1] for u in uploads], [u[3] for u in uploads]),
+    )
+    ids = {ord_: img_id for img_id, ord_ in cur.fetchall()}
+
+    results = []
+    seen_new = set()
+    for ord_, u in enumerate(uploads, 1):
+        img_id, sha256 = ids[ord_], u[3]
+        is_new = sha256 in created and sha256 not in seen_new
+        seen_new.add(sha256)
+        results.append((img_id, is_new))
+    return results
+
+
+# ===================== IMAGE DERIVATIVES (thumbnails / WebP) =====================
+
+# Target widths for resized variants. Originals are never upscaled.
+IMAGE_VARIANT_WIDTHS = sorted(
+    int(w) for w in os.environ.get("IMAGE_VARIANT_WIDTHS", "320,640,1280").split(",") if w.strip()
+)
+IMAGE_VARIANT_WORKERS = int(os.environ.get("IMAGE_VARIANT_WORKERS", 2))
+IMAGE_VARIANT_QUALITY = int(os.environ.get("IMAGE_VARIANT_QUALITY", 80))
+
+# Background pool so uploads return before resizing is done.
+_variant_executor = ThreadPoolExecutor(max_workers=IMAGE_VARIANT_WORKERS, thread_name_prefix="img-variant")
+
+
+def _encode_variant(img, fmt: str) -> bytes:
+    buf = BytesIO()
+    if fmt == "webp":
+        img.save(buf, "WEBP", quality=IMAGE_VARIANT_QUALITY, method=4)
+    elif fmt == "jpeg":
+        img.convert("RGB").save(buf, "JPEG", quality=IMAGE_VARIANT_QUALITY, optimize=True, progressive=True)
+    else:
+        img.save(buf, "PNG", optimize=True)
+    return buf.getvalue()
+
+
+def build_image_variants(data: bytes):
+    """
+    Decode an original and return (width, height, variants) where variants is a list of
+    (width, height, format, content_type, bytes).
 
-@app.route("/close-booking", methods=["GET", "POST"])
-def close_booking_route():
+    Every target width gets a WebP variant plus a fallback for clients without WebP
+    support: JPEG for opaque images, PNG when the image has transparency.
     """
-    Close single booking and move it to ClosedBookings sheet.
+    with Image.open(BytesIO(data)) as src:
+        src.load()
+        orig_w, orig_h = src.size
+        has_alpha = src.mode in ("RGBA", "LA", "PA") or (src.mode == "P" and "transparency" in src.info)
+        base = src.convert("RGBA" if has_alpha else "RGB")
+
+    fallback = ("png", "image/png") if has_alpha else ("jpeg", "image/jpeg")
+    variants = []
+    for target_w in IMAGE_VARIANT_WIDTHS:
+        if target_w >= orig_w:
+            break
+        target_h = max(1, round(orig_h * target_w / orig_w))
+        resized = base.resize((target_w, target_h), Image.LANCZOS)
+        for fmt, ctype in (("webp", "image/webp"), fallback):
+            variants.append((target_w, target_h, fmt, ctype, _encode_variant(resized, fmt)))
+    return orig_w, orig_h, variants
 
-    Input (JSON, form or query):
-      - booking_id
 
-    Output (JSON):
-    {
-      "status": "success" | "error",
-      "message": "..."
-    }
+def generate_image_variants(image_id: int, sha256: str, data: bytes = None):
+    """
+    Background job: store original dimensions + resized variants for one upload.
+    Without `data` the original is read back from its blob store here, so callers
+    don't have to hold the bytes in memory while the job waits in the queue.
     """
-    # ---- read input ----
     try:
-        if request.is_json:
-            data = request.get_json(silent=True) or {}
-        elif request.form:
-            data = request.form.to_dict()
-        elif request.args:
-            data = request.args.to_dict()
-        else:
-            data = {}
+        if data is None:
+            with db_conn() as conn:
+                cur = conn.cursor()
+                data = read_blob(cur, sha256)
+                cur.close()
+            if data is None:
+                return
+        orig_w, orig_h, variants = build_image_variants(data)
+
+        with db_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "UPDATE image_blobs SET width = %s, height = %s WHERE sha256 = %s;",
+                (orig_w, orig_h, sha256),
+            )
+            for v_w, v_h, fmt, ctype, v_data in variants:
+                cur.execute(
+                    """
+                    INSERT INTO image_variants
+                        (source_sha256, width, height, format, content_type, byte_size, data)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (source_sha256, width, format) DO NOTHING;
+                    """,
+                    (sha256, v_w, v_h, fmt, ctype, len(v_data), psycopg2.Binary(v_data)),
+                )
+            # dimensions are part of the featured packages response → mark it stale
+            cur.execute(
+                """
+                UPDATE featured_packages SET updated_at = NOW()
+                WHERE image_id IN (SELECT id FROM uploaded_images WHERE sha256 = %s);
+                """,
+                (sha256,),
+            )
+            conn.commit()
+            cur.close()
     except Exception as e:
-        return Response(
-            json.dumps({"status": "error", "message": f"Error parsing request body: {e}"}),
-            status=400,
-            mimetype="application/json",
-        )
+        print(f"IMAGE VARIANT ERROR (image {image_id}):", e)
 
-    booking_id = (data.get("booking_id") or "").strip()
 
-    if not booking_id:
-        return Response(
-            json.dumps({"status": "error", "message": "Missing parameter: booking_id"}),
-            status=400,
-            mimetype="application/json",
-        )
+def schedule_image_variants(image_id: int, sha256: str, data: bytes = None):
+    """Queue derivative generation for a fresh upload (no-op without Pillow); see generate_image_variants."""
+    if Image is None or not IMAGE_VARIANT_WIDTHS:
+        return None
+    return _variant_executor.submit(generate_image_variants, image_id, sha256, data)
 
-    try:
-        ok, msg = close_booking_in_sheets(booking_id)
-    except Exception as e:
-        ok = False
-        msg = f"Unexpected error while closing booking: {e}"
 
-    status = "success" if ok else "error"
-    return Response(
-        json.dumps({"status": status, "message": msg}),
-        status=200,
-        mimetype="application/json",
-    )
+def backfill_image_variants(batch_size: int = 50, all_blobs: bool = False) -> int:
+    """
+    Run generate_image_variants for blobs stored before it existed (width IS NULL),
+    or for every blob with all_blobs=True (e.g. after changing IMAGE_VARIANT_WIDTHS;
+    existing variants are kept). Synchronous, batch by batch in hash order.
+    Returns the number of blobs processed.
+    """
+    done = 0
+    last_sha = ""
+    while True:
+        with db_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                SELECT b.sha256, min(i.id)
+                FROM image_blobs b
+                JOIN uploaded_images i ON i.sha256 = b.sha256
+                WHERE b.sha256 > %s {"" if all_blobs else "AND b.width IS NULL"}
+                GROUP BY b.sha256
+                ORDER BY b.sha256
+                LIMIT %s;
+                """,
+                (last_sha, batch_size),
+            )
+            batch = cur.fetchall()
+            cur.close()
+        if not batch:
+            return done
+        for sha256, image_id in batch:
+            generate_image_variants(image_id, sha256)
+            last_sha = sha256
+            done += 1
+        print(f"processed {done} blob(s) so far (last {last_sha[:12]}…)")
+
+
+@app.cli.command("backfill-image-variants")
+@click.option("--batch-size", default=50, show_default=True)
+@click.option("--all", "all_blobs", is_flag=True, help="Also blobs that already have dimensions.")
+def backfill_image_variants_command(batch_size, all_blobs):
+    """Store dimensions + variants for images uploaded before variants existed."""
+    if Image is None:
+        raise SystemExit("Pillow is not installed")
+    done = backfill_image_variants(batch_size=batch_size, all_blobs=all_blobs)
+    print(f"✅ done – {done} blob(s) processed")
 
 
 # ===================== IMAGE UPLOAD HTML PAGE =====================
@@ -973,23 +3871,16 @@ def upload_image():
 
     filename = file.filename
     content_type = file.mimetype or "application/octet-stream"
-    data = file.read()
+    data, sha256 = read_upload(file)
 
     try:
-        conn = get_db_conn()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO uploaded_images (filename, content_type, data)
-            VALUES (%s, %s, %s)
-            RETURNING id;
-            """,
-            (filename, content_type, psycopg2.Binary(data)),
-        )
-        img_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
+        with db_conn() as conn:
+            cur = conn.cursor()
+            img_id, is_new_blob = save_uploaded_image(cur, filename, content_type, data, sha256)
+            conn.commit()
+            cur.close()
+        if is_new_blob:
+            schedule_image_variants(img_id, sha256, data)
     except Exception as e:
         print("IMAGE UPLOAD ERROR:", e)
         return Response(f"Error saving image: {e}", status=500, mimetype="text/plain")
@@ -1012,30 +3903,260 @@ def upload_image():
     return Response(html, mimetype="text/html")
 
 
+# ===================== IN-PROCESS IMAGE CACHE =====================
+
+# Total bytes of image data kept per worker, and the largest single image cached.
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+IMAGE_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_ENTRY_BYTES", 4 * 1024 * 1024))
+
+
+class ImageCache:
+    """
+    LRU cache for image rows, bounded by total bytes (not entry count).
+
+    Values are stored as immutable `bytes` and handed out as-is, so every
+    request thread in the worker shares the same copy.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()  # key -> (data, content_type, etag, created_at)
+        self._lock = threading.Lock()
+        self.bytes_held = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0  # entries larger than max_entry_bytes
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, data: bytes, content_type: str, etag, created_at) -> bool:
+        size = len(data)
+        if size > self.max_entry_bytes or size > self.max_bytes:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes_held -= len(old[0])
+
+            self._entries[key] = (data, content_type, etag, created_at)
+            self.bytes_held += size
+
+            # evict least recently used until we fit again
+            while self.bytes_held > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes_held -= len(evicted[0])
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes_held = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes_held": self.bytes_held,
+                "max_bytes": self.max_bytes,
+                "max_entry_bytes": self.max_entry_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+            }
+
+
+# One cache per worker process.
+image_cache = ImageCache(IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_MAX_ENTRY_BYTES)
+
+
+@app.route("/image-cache/stats", methods=["GET"])
+def image_cache_stats_route():
+    """Admin: this worker's image cache counters."""
+    if not _admin_authorized():
+        return json_response({"status": "error", "message": "Forbidden"}, status=403)
+    return json_response(image_cache.stats(), status=200)
+
+
 # ===================== IMAGE FETCH ROUTE =====================
 
+# Images are never modified after upload → cache them "forever".
+IMAGE_CACHE_MAX_AGE = 365 * 24 * 60 * 60  # 1 year
+# Short cache for "?w=" requests answered with the original while variants are still being built.
+IMAGE_FALLBACK_MAX_AGE = 60
+
+
+def _apply_image_cache_headers(resp, etag, created_at, immutable=True):
+    """Set strong ETag, Last-Modified and (by default) immutable Cache-Control on an image response."""
+    if etag:
+        resp.set_etag(etag)
+    if created_at:
+        resp.last_modified = created_at
+    resp.cache_control.public = True
+    if immutable:
+        resp.cache_control.max_age = IMAGE_CACHE_MAX_AGE
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.max_age = IMAGE_FALLBACK_MAX_AGE
+    return resp
+
+
+def _image_not_modified(etag, created_at) -> bool:
+    """
+    Evaluate If-None-Match / If-Modified-Since against image metadata.
+    If-None-Match wins when both are sent (RFC 7232 §6).
+    """
+    if request.if_none_match:
+        return bool(etag) and request.if_none_match.contains(etag)
+    if request.if_modified_since and created_at:
+        return created_at.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def _requested_variant_width():
+    """Width asked for via ?w=<px> (None → serve the original)."""
+    try:
+        w = int(request.args.get("w", ""))
+    except ValueError:
+        return None
+    return w if w > 0 else None
+
+
+def _accepts_webp() -> bool:
+    """
+    True only when Accept names image/webp itself with q > 0 – "*/*" and "image/*"
+    are sent by browsers that can't decode WebP (older Safari) too.
+    """
+    return any(value.lower() == "image/webp" and quality > 0 for value, quality in request.accept_mimetypes)
+
+
+def _image_response(data, content_type, etag, created_at, immutable=True, vary_accept=False):
+    if _image_not_modified(etag, created_at):
+        resp = Response(status=304)
+    else:
+        resp = Response(data, mimetype=content_type)
+    if vary_accept:
+        resp.vary.add("Accept")
+    return _apply_image_cache_headers(resp, etag, created_at, immutable=immutable)
+
+
 @app.route("/image/<int:image_id>", methods=["GET","POST"])
 def get_image(image_id):
+    """
+    Serve an uploaded image.
+
+    ?w=<px> picks the smallest stored variant at least that wide (the original when
+    none is wide enough); WebP only when the client's Accept lists image/webp.
+    """
+    want_w = _requested_variant_width()
+    want_webp = bool(want_w) and _accepts_webp()
+    cache_key = (image_id, want_w, want_webp) if want_w else image_id
+
+    # ---- hot path: served from the in-process cache, no DB round trip ----
+    cached = image_cache.get(cache_key)
+    if cached is not None:
+        data, content_type, etag, created_at = cached
+        return _image_response(data, content_type, etag, created_at, vary_accept=bool(want_w))
+
     try:
-        conn = get_db_conn()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT filename, content_type, data
-            FROM uploaded_images
-            WHERE id = %s;
-            """,
-            (image_id,),
-        )
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+        with db_conn() as conn:
+            cur = conn.cursor()
+            # metadata only – never touches the BYTEA column
+            cur.execute(
+                """
+                SELECT content_type, sha256, created_at
+                FROM uploaded_images
+                WHERE id = %s;
+                """,
+                (image_id,),
+            )
+            meta = cur.fetchone()
+
+            if not meta:
+                return Response("Image not found", status=404, mimetype="text/plain")
+
+            content_type, sha256, created_at = meta[0], meta[1], meta[2]
+            etag = sha256
+            variant = None
+
+            if want_w:
+                # smallest variant at least as wide as requested; variants are only made
+                # below the original's width, so no match means the original is the best fit
+                cur.execute(
+                    f"""
+                    SELECT id, width, format, content_type
+                    FROM image_variants
+                    WHERE source_sha256 = %s AND format {"=" if want_webp else "<>"} 'webp' AND width >= %s
+                    ORDER BY width
+                    LIMIT 1;
+                    """,
+                    (sha256, want_w),
+                )
+                variant = cur.fetchone()
+                if variant:
+                    content_type = variant[3]
+                    etag = f"{sha256}-w{variant[1]}.{variant[2]}"
+
+            if _image_not_modified(etag, created_at):
+                return _image_response(None, content_type, etag, created_at,
+                                       immutable=not want_w or bool(variant), vary_accept=bool(want_w))
+
+            if variant:
+                cur.execute("SELECT data FROM image_variants WHERE id = %s;", (variant[0],))
+            else:
+                # storage + data in one statement so a concurrent storage migration
+                # can't leave us with storage='postgres' but data already moved out
+                cur.execute(
+                    """
+                    SELECT storage, data
+                    FROM image_blobs
+                    WHERE sha256 = %s;
+                    """,
+                    (sha256,),
+                )
+            row = cur.fetchone()
+            cur.close()
 
         if not row:
             return Response("Image not found", status=404, mimetype="text/plain")
 
-        filename, content_type, data = row[0], row[1], row[2]
-        return Response(data, mimetype=content_type)
+        if not variant and row[0] == FilesystemBlobStore.name:
+            # Let the server hand the file to the kernel (wsgi.file_wrapper → sendfile);
+            # the OS page cache does the caching, so skip the in-process cache here.
+            path = blob_stores[FilesystemBlobStore.name].path(sha256)
+            if not os.path.exists(path):
+                return Response("Image not found", status=404, mimetype="text/plain")
+            resp = send_file(path, mimetype=content_type, conditional=False, etag=False, max_age=IMAGE_CACHE_MAX_AGE)
+            resp.headers.pop("Content-Disposition", None)  # don't leak the on-disk hash filename
+            resp.headers.pop("Expires", None)  # Cache-Control below is authoritative
+            if want_w:
+                resp.vary.add("Accept")
+            return _apply_image_cache_headers(resp, etag, created_at, immutable=not want_w)
+
+        data = bytes(row[-1])
+        # A "?w=" request served with the original may get a real variant later → don't pin it.
+        immutable = not want_w or bool(variant)
+        if immutable:
+            image_cache.put(cache_key, data, content_type, etag, created_at)
+
+        return _image_response(data, content_type, etag, created_at,
+                               immutable=immutable, vary_accept=bool(want_w))
     except Exception as e:
         print("GET IMAGE ERROR:", e)
         return Response(f"Error fetching image: {e}", status=500, mimetype="text/plain")
@@ -1047,111 +4168,603 @@ def get_image(image_id):
 def api_upload_image():
     file = request.files.get("image")
     if not file or file.filename == "":
-        return Response(
-            json.dumps({"status": "error", "message": "No file uploaded"}),
-            status=400,
-            mimetype="application/json",
-        )
+        return json_response({"status": "error", "message": "No file uploaded"}, status=400)
 
     filename = file.filename
     content_type = file.mimetype or "application/octet-stream"
-    data = file.read()
+    data, sha256 = read_upload(file)
 
     try:
-        conn = get_db_conn()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO uploaded_images (filename, content_type, data)
-            VALUES (%s, %s, %s)
-            RETURNING id;
-            """,
-            (filename, content_type, psycopg2.Binary(data)),
-        )
-        img_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
+        with db_conn() as conn:
+            cur = conn.cursor()
+            img_id, is_new_blob = save_uploaded_image(cur, filename, content_type, data, sha256)
+            conn.commit()
+            cur.close()
+        if is_new_blob:
+            schedule_image_variants(img_id, sha256, data)
     except Exception as e:
         print("API IMAGE UPLOAD ERROR:", e)
-        return Response(
-            json.dumps({"status": "error", "message": str(e)}),
-            status=500,
-            mimetype="application/json",
-        )
+        return json_response({"status": "error", "message": str(e)}, status=500)
 
     img_url = f"/image/{img_id}"
 
-    return Response(
-        json.dumps(
-            {
-                "status": "success",
-                "id": img_id,
-                "filename": filename,
-                "url": img_url,
-            }
-        ),
+    return json_response(
+        {
+            "status": "success",
+            "id": img_id,
+            "filename": filename,
+            "url": img_url,
+        },
         status=200,
-        mimetype="application/json",
     )
 
-@app.route("/featured-packages", methods=["GET","POST"])
-def featured_packages_route():
+
+# ===================== BULK IMAGE UPLOAD API =====================
+
+BULK_UPLOAD_MAX_FILES = int(os.environ.get("BULK_UPLOAD_MAX_FILES", 200))
+
+
+@app.route("/api/upload-images", methods=["POST"])
+def api_upload_images():
+    """
+    Upload many images in one multipart request (field name "images", repeated).
+    All rows are written in one transaction on a pooled connection.
+
+    Output (JSON), in upload order:
+    {
+        "status": "success",
+        "images": [
+            {"id": 12, "filename": "...", "url": "/image/12", "duplicate": false},
+            ...
+        ]
+    }
     """
-    Return featured packages (Goa, Manali, etc.) with image URLs.
-    These image_url values can be /image/<id> from your Postgres table.
+    files = [f for f in request.files.getlist("images") if f and f.filename]
+    if not files:
+        return json_response({"status": "error", "message": "No files uploaded"}, status=400)
+    if len(files) > BULK_UPLOAD_MAX_FILES:
+        return json_response(
+            {"status": "error", "message": f"Too many files (max {BULK_UPLOAD_MAX_FILES})"},
+            status=400,
+        )
+
+    uploads = []
+    for f in files:
+        sha256, byte_size = hash_upload(f)
+        uploads.append((f.filename, f.mimetype or "application/octet-stream", f.stream, sha256, byte_size))
+
+    try:
+        with db_conn() as conn:
+            cur = conn.cursor()
+            results = save_uploaded_images_bulk(cur, uploads)
+            conn.commit()
+            cur.close()
+    except Exception as e:
+        print("API BULK IMAGE UPLOAD ERROR:", e)
+        return json_response({"status": "error", "message": str(e)}, status=500)
+
+    images = []
+    for (img_id, is_new_blob), (filename, _ctype, _stream, sha256, _size) in zip(results, uploads):
+        if is_new_blob:
+            # the worker reads the committed blob back itself – keeps up to
+            # BULK_UPLOAD_MAX_FILES originals out of memory and off the queue
+            schedule_image_variants(img_id, sha256)
+        images.append({
+            "id": img_id,
+            "filename": filename,
+            "url": f"/image/{img_id}",
+            "duplicate": not is_new_blob,
+        })
+
+    return json_response({"status": "success", "images": images}, status=200)
+
+
+
+# ===================== IMAGE LISTING API (metadata only) =====================
+
+IMAGE_LIST_DEFAULT_LIMIT = 50
+IMAGE_LIST_MAX_LIMIT = 500
+
+
+def _parse_iso_datetime(value: str):
+    value = (value or "").strip()
+    if not value:
+        return None
+    # accept the trailing "Z" JS / Deluge send
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+@app.route("/api/images", methods=["GET"])
+def api_list_images():
+    """
+    Admin (X-Admin-Token): list uploaded images without reading any image bytes.
+
+    Query params (all optional):
+      - after         : id cursor; returns images with id > after (use "next_after" from the previous page)
+      - limit         : page size (default 50, max 500)
+      - content_type  : exact match, e.g. image/png
+      - since / until : ISO 8601 created_at range (since inclusive, until exclusive)
+
+    Output (JSON):
+    {
+        "images": [
+            {"id": 3, "filename": "...", "content_type": "...", "byte_size": 123,
+             "sha256": "...", "width": 1280, "height": 720, "created_at": "...", "url": "/image/3"},
+            ...
+        ],
+        "next_after": 3   // null on the last page
+    }
     """
-    # TODO: real image IDs use panra id replace pannu
-    goa_img_url = "https://apia2m.onrender.com/image/3"      # example
-    manali_img_url = "https://apia2m.onrender.com/image/4"   # example
+    if not _admin_authorized():
+        return json_response({"status": "error", "message": "Forbidden"}, status=403)
 
-    packages = [
+    args = request.args
+    try:
+        after = int(args.get("after", 0) or 0)
+        limit = int(args.get("limit", IMAGE_LIST_DEFAULT_LIMIT) or IMAGE_LIST_DEFAULT_LIMIT)
+        since = _parse_iso_datetime(args.get("since"))
+        until = _parse_iso_datetime(args.get("until"))
+    except ValueError as e:
+        return json_response({"status": "error", "message": f"Invalid parameter: {e}"}, status=400)
+    limit = max(1, min(limit, IMAGE_LIST_MAX_LIMIT))
+    content_type = (args.get("content_type") or "").strip()
+
+    where = ["i.id > %s"]
+    params = [after]
+    if content_type:
+        where.append("i.content_type = %s")
+        params.append(content_type)
+    if since:
+        where.append("i.created_at >= %s")
+        params.append(since)
+    if until:
+        where.append("i.created_at < %s")
+        params.append(until)
+    params.append(limit + 1)  # one extra row tells us whether there is a next page
+
+    try:
+        with db_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                SELECT i.id, i.filename, i.content_type, b.byte_size, i.sha256,
+                       COALESCE(b.width, i.width), COALESCE(b.height, i.height), i.created_at
+                FROM uploaded_images i
+                LEFT JOIN image_blobs b ON b.sha256 = i.sha256
+                WHERE {" AND ".join(where)}
+                ORDER BY i.id
+                LIMIT %s;
+                """,
+                params,
+            )
+            rows = cur.fetchall()
+            cur.close()
+    except Exception as e:
+        print("LIST IMAGES ERROR:", e)
+        return json_response({"status": "error", "message": str(e)}, status=500)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    images = [
         {
-            "id": "goa_pkg",
-            "name": "Goa Beach Escape – 3D/2N",
-            "price_text": "₹7,499 per person",
-            "image_url": goa_img_url,
-            "btn_label": "View Goa Plan",
-            "btn_payload": "Goa Package",
-        },
+            "id": r[0],
+            "filename": r[1],
+            "content_type": r[2],
+            "byte_size": r[3],
+            "sha256": r[4],
+            "width": r[5],
+            "height": r[6],
+            "created_at": r[7].isoformat() if r[7] else None,
+            "url": f"/image/{r[0]}",
+        }
+        for r in rows
+    ]
+
+    resp = {"images": images, "next_after": images[-1]["id"] if has_more else None}
+    return json_response(resp, status=200)
+
+
+# ===================== FEATURED PACKAGES (catalogue in Postgres) =====================
+
+# How often a worker checks whether the catalogue changed (one tiny query, no joins).
+FEATURED_REFRESH_SECONDS = int(os.environ.get("FEATURED_REFRESH_SECONDS", 30))
+FEATURED_MAX_AGE = 60
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+
+def _admin_authorized() -> bool:
+    """Admin endpoints require X-Admin-Token to match ADMIN_TOKEN (disabled when unset)."""
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def _package_image_url(image_id) -> str:
+    return f"{PUBLIC_BASE_URL}/image/{image_id}" if image_id else ""
+
+
+def load_featured_packages(cur):
+    """Read active packages in display order, resolving image URL + dimensions."""
+    cur.execute(
+        """
+        SELECT p.id, p.name, p.price_text, p.image_id, p.btn_label, p.btn_payload,
+               COALESCE(b.width, i.width), COALESCE(b.height, i.height)
+        FROM featured_packages p
+        LEFT JOIN uploaded_images i ON i.id = p.image_id
+        LEFT JOIN image_blobs b ON b.sha256 = i.sha256
+        WHERE p.active
+        ORDER BY p.sort_order, p.id;
+        """
+    )
+    return [
         {
-            "id": "manali_pkg",
-            "name": "Manali Snow Adventure – 5D/4N",
-            "price_text": "₹12,999 per person",
-            "image_url": manali_img_url,
-            "btn_label": "View Manali Plan",
-            "btn_payload": "Manali Package",
-        },
+            "id": r[0],
+            "name": r[1],
+            "price_text": r[2],
+            "image_url": _package_image_url(r[3]),
+            "image_width": r[6],
+            "image_height": r[7],
+            "btn_label": r[4],
+            "btn_payload": r[5],
+        }
+        for r in cur.fetchall()
     ]
 
-    return Response(json.dumps(packages), status=200, mimetype="application/json")
+
+class FeaturedPackagesBuffer:
+    """
+    Pre-serialized /featured-packages response: one immutable (body, body_gzip, etag)
+    tuple, rebuilt only when the catalogue version (max(updated_at), count) changes and
+    published in a single assignment so lock-free readers never mix two builds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.response = None  # (body, body_gzip, etag)
+        self._checked_at = 0.0
+
+    def _build(self, packages):
+        body = dumps_json(packages)
+        self.response = (
+            body,
+            gzip.compress(body, compresslevel=9, mtime=0),
+            hashlib.sha256(body).hexdigest()[:32],
+        )
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = 0.0
+            self.version = None
+
+    def get(self):
+        """Return (body, body_gzip, etag), refreshing from Postgres when due."""
+        now = time.time()
+        response = self.response
+        if response is not None and now - self._checked_at < FEATURED_REFRESH_SECONDS:
+            return response
+
+        with self._lock:
+            if self.response is not None and now - self._checked_at < FEATURED_REFRESH_SECONDS:
+                return self.response  # another thread refreshed it
+            try:
+                with db_conn() as conn:
+                    cur = conn.cursor()
+                    cur.execute("SELECT max(updated_at), count(*) FROM featured_packages;")
+                    version = cur.fetchone()
+                    if version != self.version or self.response is None:
+                        self._build(load_featured_packages(cur))
+                        self.version = version
+                    cur.close()
+            except Exception as e:
+                print("FEATURED PACKAGES ERROR:", e)
+                if self.response is None:
+                    # never fail the widget: fall back to the built-in catalogue
+                    self._build([
+                        {
+                            "id": p["id"],
+                            "name": p["name"],
+                            "price_text": p["price_text"],
+                            "image_url": _package_image_url(p["image_id"]),
+                            "image_width": None,
+                            "image_height": None,
+                            "btn_label": p["btn_label"],
+                            "btn_payload": p["btn_payload"],
+                        }
+                        for p in DEFAULT_FEATURED_PACKAGES
+                    ])
+            self._checked_at = now
+            return self.response
+
+
+featured_packages_buffer = FeaturedPackagesBuffer()
+
+
+@app.route("/featured-packages", methods=["GET","POST"])
+def featured_packages_route():
+    """
+    Return featured packages (Goa, Manali, etc.) with image URLs and image dimensions.
+    Catalogue lives in the featured_packages table; image URLs are /image/<id>.
+    """
+    body, body_gzip, etag = featured_packages_buffer.get()
+
+    # the gzip body is a different representation → its own strong ETag
+    use_gzip = request.accept_encodings["gzip"] > 0
+    if use_gzip:
+        etag = f"{etag}-gz"
+
+    if request.if_none_match and request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    elif use_gzip:
+        resp = Response(body_gzip, status=200, mimetype="application/json")
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = Response(body, status=200, mimetype="application/json")
+
+    resp.set_etag(etag)
+    resp.vary.add("Accept-Encoding")
+    resp.cache_control.public = True
+    resp.cache_control.max_age = FEATURED_MAX_AGE
+    return resp
+
+
+PG_INT_MAX = 2**31 - 1
+_INVALID = object()
+
+
+def _featured_int_field(value, minimum: int, default=None):
+    """Strict int for a package field: None / "" → default, out of range or non-integer → _INVALID."""
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return _INVALID
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, str) and re.fullmatch(r"\s*-?\d+\s*", value):
+        value = int(value)
+    if not isinstance(value, int) or not minimum <= value <= PG_INT_MAX:
+        return _INVALID
+    return value
+
+
+@app.route("/api/featured-packages", methods=["POST"])
+def api_update_featured_packages():
+    """
+    Admin: create/update featured packages (header X-Admin-Token).
+
+    Input (JSON): one package object or a list of them, e.g.
+      {"id": "goa_pkg", "name": "...", "price_text": "...", "image_id": 3,
+       "btn_label": "...", "btn_payload": "...", "sort_order": 0, "active": true}
+    """
+    if not _admin_authorized():
+        return json_response({"status": "error", "message": "Forbidden"}, status=403)
+
+    data = request.get_json(silent=True)
+    items = data if isinstance(data, list) else [data] if isinstance(data, dict) else []
+    if not items or any(not isinstance(p, dict) or not str(p.get("id") or "").strip() for p in items):
+        return json_response(
+            {"status": "error", "message": "Expected a package object (or list) with an 'id'"},
+            status=400,
+        )
+
+    rows = []
+    for p in items:
+        pkg_id = str(p["id"]).strip()
+        image_id = _featured_int_field(p.get("image_id"), minimum=1)
+        sort_order = _featured_int_field(p.get("sort_order"), minimum=-PG_INT_MAX, default=0)
+        if image_id is _INVALID:
+            return json_response(
+                {"status": "error", "message": f"Package '{pkg_id}': image_id must be a positive integer"},
+                status=400,
+            )
+        if sort_order is _INVALID:
+            return json_response(
+                {"status": "error", "message": f"Package '{pkg_id}': sort_order must be an integer"},
+                status=400,
+            )
+        rows.append((
+            pkg_id,
+            str(p.get("name") or ""),
+            str(p.get("price_text") or ""),
+            image_id,
+            str(p.get("btn_label") or ""),
+            str(p.get("btn_payload") or ""),
+            sort_order,
+            bool(p.get("active", True)),
+        ))
+
+    try:
+        with db_conn() as conn:
+            cur = conn.cursor()
+            image_ids = sorted({r[3] for r in rows if r[3] is not None})
+            if image_ids:
+                cur.execute("SELECT id FROM uploaded_images WHERE id = ANY(%s);", (image_ids,))
+                missing = set(image_ids) - {r[0] for r in cur.fetchall()}
+                if missing:
+                    cur.close()
+                    return json_response(
+                        {"status": "error", "message": f"Unknown image_id: {', '.join(map(str, sorted(missing)))}"},
+                        status=400,
+                    )
+            execute_values(
+                cur,
+                """
+                INSERT INTO featured_packages
+                    (id, name, price_text, image_id, btn_label, btn_payload, sort_order, active)
+                VALUES %s
+                ON CONFLICT (id) DO UPDATE SET
+                    name = EXCLUDED.name,
+                    price_text = EXCLUDED.price_text,
+                    image_id = EXCLUDED.image_id,
+                    btn_label = EXCLUDED.btn_label,
+                    btn_payload = EXCLUDED.btn_payload,
+                    sort_order = EXCLUDED.sort_order,
+                    active = EXCLUDED.active,
+                    updated_at = NOW();
+                """,
+                rows,
+            )
+            conn.commit()
+            cur.close()
+    except Exception as e:
+        print("FEATURED PACKAGES UPDATE ERROR:", e)
+        return json_response({"status": "error", "message": str(e)}, status=500)
+
+    # this worker rebuilds right away; others pick it up within FEATURED_REFRESH_SECONDS
+    featured_packages_buffer.invalidate()
+    return json_response({"status": "success", "updated": [r[0] for r in rows]}, status=200)
+
+
 @app.route("/dummy", methods=["GET", "POST"])
 def dummy_api():
-    data = {}
-
     try:
-        if request.is_json:
-            data = request.get_json(silent=True) or {}
-        elif request.form:
-            data = request.form.to_dict()
-        elif request.args:
-            data = request.args.to_dict()
-    except:
-        pass
-
-    return Response(
-        json.dumps({
+        data = get_request_data()
+    except Exception:
+        data = {}
+
+    return json_response(
+        {
             "status": "success",
             "message": "Dummy API called successfully!",
-            "received": data
-        }),
-        mimetype="application/json",
-        status=200
+            "received": data,
+        },
+        status=200,
     )
 
+# ===================== WORKER WARM-UP / READINESS =====================
+
+# post_worker_init (gunicorn.conf.py) runs warm_up() before the worker accepts traffic.
+# WARMUP_BLOCKING=0 runs it in the background instead; /ready reports 503 until it's done.
+WARMUP_BLOCKING = os.environ.get("WARMUP_BLOCKING", "1").lower() not in ("0", "false", "no")
+
+_warmup = {"state": "not_started", "started_at": None, "finished_at": None, "steps": {}}
+_warmup_lock = threading.Lock()
+
+
+def _warm_step(name, fn):
+    start = time.time()
+    try:
+        detail = fn()
+        _warmup["steps"][name] = {"ok": True, "ms": round((time.time() - start) * 1000, 1), "detail": detail}
+    except Exception as e:
+        _warmup["steps"][name] = {"ok": False, "ms": round((time.time() - start) * 1000, 1), "error": str(e)}
+
+
+def _warm_postgres():
+    if not DATABASE_URL:
+        return "skipped (DATABASE_URL not set)"
+    with db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT 1;")
+        cur.close()
+    return f"pool ready (min {DB_POOL_MIN}, max {DB_POOL_MAX})"
+
+
+def _warm_gemini():
+    if not GEMINI_API_KEY:
+        return "skipped (GEMINI_API_KEY not set)"
+    # cheap authenticated call → DNS + TLS + keep-alive connection in the shared pool
+    r = get_http_session().get(MODELS_LIST_URL, params={"key": GEMINI_API_KEY, "pageSize": 1}, timeout=10)
+    return f"HTTP {r.status_code}"
+
+
+def _warm_sheets():
+    if not GOOGLE_SERVICE_ACCOUNT_JSON or not GOOGLE_SHEET_ID:
+        return "skipped (Sheets not configured)"
+    get_spreadsheet()  # OAuth token + spreadsheet metadata
+    rows = {name: len(get_sheet_rows(name)) for name in (TRIPPLAN_SHEET_NAME, BOOKINGS_SHEET_NAME)}
+    return {"snapshot_rows": rows}
+
+
+def _warm_featured():
+    if not DATABASE_URL:
+        return "skipped (DATABASE_URL not set)"
+    featured_packages_buffer.get()
+    with db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT image_id FROM featured_packages WHERE active AND image_id IS NOT NULL;")
+        image_ids = [r[0] for r in cur.fetchall()]
+        cur.close()
+    # go through the real route so the cache holds exactly what /image/<id> would serve
+    for image_id in image_ids:
+        with app.test_request_context(f"/image/{image_id}"):
+            get_image(image_id)
+    return {"images_primed": image_ids}
+
+
+def _warm_quote():
+    return city_distances.load().stats()
+
+
+def warm_up():
+    """
+    Open upstream connections and fill the hot caches for this worker:
+    Postgres pool, Gemini TLS connection, Sheets auth + snapshots,
+    featured packages buffer + their images, /quote coordinate table.
+    Failures are recorded, never raised.
+    """
+    with _warmup_lock:
+        if _warmup["state"] in ("warming", "ready"):
+            return _warmup
+        _warmup["state"] = "warming"
+        _warmup["started_at"] = time.time()
+
+    get_metrics()
+    _warm_step("postgres", _warm_postgres)
+    _warm_step("gemini", _warm_gemini)
+    _warm_step("sheets", _warm_sheets)
+    _warm_step("featured", _warm_featured)
+    _warm_step("quote", _warm_quote)
+
+    _warmup["finished_at"] = time.time()
+    _warmup["state"] = "ready"
+    return _warmup
+
+
+def start_warm_up():
+    """Entry point for the gunicorn hook."""
+    start_sheet_change_listener()
+    start_trip_plan_job_sweeper()
+    if WARMUP_BLOCKING:
+        warm_up()
+    else:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+@app.route("/ready", methods=["GET"])
+def ready_route():
+    """
+    Readiness probe (as opposed to `/`, which only says the process is up):
+    503 until this worker's warm-up has finished (or when it never ran), 200 after.
+    A finished warm-up with failed steps reports "degraded" and lists them – the
+    worker still serves, those upstreams are just cold or unreachable.
+    Warm-up step details and cache stats are included for admins (X-Admin-Token).
+    """
+    state = _warmup["state"]
+    failed = sorted(name for name, step in _warmup["steps"].items() if not step.get("ok"))
+    if state != "ready":
+        status = "warming" if state == "warming" else "not_warmed"
+    else:
+        status = "degraded" if failed else "ready"
+
+    body = {"status": status, "failed_steps": failed}
+    if _admin_authorized():
+        body.update({
+            "warmup": _warmup,
+            "sheet_cache": sheet_cache.stats(),
+            "trip_plan_cache": trip_plan_cache.stats(),
+            "image_cache": image_cache.stats(),
+        })
+    resp = json_response(body, status=200 if state == "ready" else 503)
+    resp.cache_control.no_store = True
+    return resp
+
+
 # ===================== MAIN =====================
 
 if __name__ == "__main__":
     # For local testing
+    run_db_migrations()
+    start_warm_up()  # what gunicorn's post_worker_init does, so /ready works here too
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port, debug=True)
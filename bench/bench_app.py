@@ -0,0 +1,35 @@
+"""
+WSGI entry point for bench/harness.py: app.py with Sheets (and, unless a real
+database is given, Postgres) replaced by the fakes in bench/fakes.py.
+
+    BENCH_FAKES='{"sheets": {...}, "images": {...}, "real_db": false}' \
+        gunicorn --pythonpath bench bench_app:app
+
+Gemini is not patched here – the harness runs FakeGeminiServer and points
+GEMINI_API_BASE at it, so the real HTTP client path is exercised.
+Every worker builds identical fake data from the same seed.
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fakes import FakeImageDB, FakeSpreadsheet  # noqa: E402
+
+import app as app_module  # noqa: E402
+
+config = json.loads(os.environ.get("BENCH_FAKES") or "{}")
+
+spreadsheet = FakeSpreadsheet(**config.get("sheets", {}))
+app_module.get_spreadsheet = lambda: spreadsheet
+# so warm-up primes the sheet snapshots like it does in production
+app_module.GOOGLE_SERVICE_ACCOUNT_JSON = app_module.GOOGLE_SHEET_ID = "bench"
+
+if not config.get("real_db"):
+    image_db = FakeImageDB(**config.get("images", {}))
+    image_db.observe = lambda sql: app_module.observe_upstream("postgres", app_module._sql_operation(sql))
+    app_module.db_conn = image_db.db_conn
+    app_module.DATABASE_URL = "fake://bench"
+
+app = app_module.app
@@ -0,0 +1,305 @@
+"""
+Local stand-ins for the service's upstreams, used by bench/harness.py.
+
+  FakeGeminiServer – HTTP server speaking just enough of generateContent / models
+                     with a configurable latency distribution and error rate.
+  FakeSpreadsheet  – gspread-like spreadsheet/worksheet objects holding generated
+                     TripPlans / Bookings rows, with configurable per-call latency.
+  FakeImageDB      – in-memory replacement for the Postgres pool (db_conn) that
+                     answers the image / featured-package queries app.py issues.
+
+Latency specs are strings:
+  "fixed:0.8"              always 0.8 s
+  "uniform:0.5,2.0"        uniformly between 0.5 and 2.0 s
+  "lognormal:1.2,0.5"      log-normal with median 1.2 s and sigma 0.5
+  "0"                      no delay
+"""
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LatencyModel:
+    def __init__(self, spec: str, seed: int = 0):
+        self.spec = spec
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        kind, _, args = (spec or "0").partition(":")
+        self.kind = kind if args else ("fixed" if kind not in ("", "0") else "none")
+        self.args = [float(a) for a in args.split(",")] if args else ([float(kind)] if self.kind == "fixed" else [])
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "none":
+                return 0.0
+            if self.kind == "fixed":
+                return self.args[0]
+            if self.kind == "uniform":
+                return self._rng.uniform(self.args[0], self.args[1])
+            if self.kind == "lognormal":
+                median, sigma = self.args
+                return self._rng.lognormvariate(math.log(median), sigma)
+        raise ValueError(f"unknown latency spec: {self.spec}")
+
+    def sleep(self):
+        delay = self.sample()
+        if delay > 0:
+            time.sleep(delay)
+
+
+# ===================== GEMINI =====================
+
+class FakeGeminiServer:
+    """
+    Serves POST /v1/models/<model>:generateContent and GET /v1/models.
+    Set GEMINI_API_BASE to `base_url` before importing app.
+    """
+
+    def __init__(self, latency: str = "fixed:1.0", error_rate: float = 0.0, seed: int = 0, port: int = 0):
+        self.latency = LatencyModel(latency, seed)
+        self.error_rate = error_rate
+        self._rng = random.Random(seed + 1)
+        self.calls = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status, obj):
+                body = json.dumps(obj).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                fake.calls += 1
+                fake.latency.sleep()
+                if fake.error_rate and fake._rng.random() < fake.error_rate:
+                    return self._send(500, {"error": {"code": 500, "message": "fake upstream error"}})
+                prompt = payload["contents"][0]["parts"][0]["text"]
+                days = 3
+                for line in prompt.splitlines():
+                    if line.startswith("Total Days:"):
+                        days = int(line.split(":", 1)[1].strip() or 3)
+                text = "\n".join(f"Day {d}: Place {d}A, Place {d}B, Place {d}C" for d in range(1, days + 1))
+                self._send(200, {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]})
+
+            def do_GET(self):
+                self._send(200, {"models": [{"name": "models/gemini-2.5-flash"}]})
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-gemini", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+# ===================== GOOGLE SHEETS =====================
+
+CITIES = ["Chennai", "Bangalore", "Mumbai", "Delhi", "Hyderabad", "Kochi", "Pune", "Jaipur", "Goa", "Manali",
+          "Ooty", "Munnar", "Coorg", "Shimla", "Rishikesh", "Udaipur", "Pondicherry", "Mysore"]
+
+BOOKING_HEADER = [
+    "Timestamp", "Booking ID", "Source", "Package Title", "Package Code", "Name", "Email", "Phone",
+    "Travel Date", "Members", "Amount Per Person", "Total Amount", "Status", "Start Location",
+    "Travel Location", "Days", "Budget Input", "Distance Km", "Travel Cost 20/km",
+    "Total Travel Allowance", "Trip Plan",
+]
+
+
+def bench_email(i: int) -> str:
+    return f"customer{i}@example.com"
+
+
+def make_trip_plan_rows(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    rows = [["Timestamp", "Start Location", "Travel Location", "Days", "Budget", "Trip Plan"]]
+    for i in range(n):
+        start, travel = rng.sample(CITIES, 2)
+        days = rng.randint(1, 7)
+        rows.append([f"2025-01-01 10:{i % 60:02d}:00", start, travel, str(days), str(rng.choice(range(3000, 30001, 500))),
+                     "\n".join(f"Day {d}: Place A, Place B" for d in range(1, days + 1))])
+    return rows
+
+
+def make_booking_rows(n: int, customers: int, seed: int = 0):
+    rng = random.Random(seed)
+    rows = [list(BOOKING_HEADER)]
+    for i in range(n):
+        start, travel = rng.sample(CITIES, 2)
+        rows.append([
+            f"2025-01-01 10:{i % 60:02d}:00", f"A2M-B-{i:08d}", "chat", f"{travel} Package", f"PKG{i % 50}",
+            f"Customer {i}", bench_email(rng.randrange(customers)), "9999999999", "2025-12-24",
+            str(rng.randint(1, 6)), "7499", "14998", rng.choice(["Active", "Active", "Active", "Closed"]),
+            start, travel, str(rng.randint(1, 7)), "5000", "350", "7000", "14000", "",
+        ])
+    return rows
+
+
+class FakeWorksheet:
+    def __init__(self, title, rows, latency: LatencyModel):
+        self.title = title
+        self._rows = rows
+        self._latency = latency
+        self._lock = threading.Lock()
+
+    def get_all_values(self):
+        self._latency.sleep()
+        with self._lock:
+            return [list(r) for r in self._rows]
+
+    def append_row(self, values):
+        self._latency.sleep()
+        with self._lock:
+            self._rows.append(list(values))
+
+    def delete_rows(self, index):
+        self._latency.sleep()
+        with self._lock:
+            del self._rows[index - 1]
+
+
+class FakeSpreadsheet:
+    def __init__(self, trip_plan_rows: int = 2000, booking_rows: int = 5000, customers: int = 1000,
+                 latency: str = "fixed:0.3", seed: int = 0):
+        self.latency = LatencyModel(latency, seed + 2)
+        self._sheets = {
+            "TripPlans": FakeWorksheet("TripPlans", make_trip_plan_rows(trip_plan_rows, seed), self.latency),
+            "Bookings": FakeWorksheet("Bookings", make_booking_rows(booking_rows, customers, seed), self.latency),
+        }
+        self._lock = threading.Lock()
+
+    def worksheet(self, name):
+        self.latency.sleep()
+        try:
+            return self._sheets[name]
+        except KeyError:
+            raise RuntimeError(f"WorksheetNotFound: {name}")
+
+    def add_worksheet(self, title, rows, cols):
+        self.latency.sleep()
+        with self._lock:
+            ws = self._sheets.setdefault(title, FakeWorksheet(title, [], self.latency))
+        return ws
+
+    def trip_plan_keys(self):
+        """(start, travel, days, budget) of every TripPlans row – used to build hitting requests."""
+        return [tuple(r[1:5]) for r in self._sheets["TripPlans"]._rows[1:]]
+
+
+# ===================== POSTGRES (images) =====================
+
+class FakeImageDB:
+    """
+    Minimal in-memory stand-in for the image tables. Only understands the read
+    queries /image/<id>, /api/images, /featured-packages and warm-up issue, with
+    an optional per-query latency to mimic a network round trip.
+    """
+
+    def __init__(self, images: int = 20, image_bytes: int = 200_000, latency: str = "fixed:0.002", seed: int = 0):
+        rng = random.Random(seed + 3)
+        self.latency = LatencyModel(latency, seed + 4)
+        # (sql) -> context manager around every query, e.g. app's postgres upstream timer
+        self.observe = lambda sql: nullcontext()
+        created = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        self.images = {}
+        self.blobs = {}
+        for i in range(1, images + 1):
+            data = rng.randbytes(image_bytes)
+            sha = hashlib.sha256(data).hexdigest()
+            self.images[i] = ("image.jpg", "image/jpeg", sha, created + timedelta(minutes=i), 1280, 853)
+            self.blobs[sha] = data
+        self.featured = [
+            ("goa_pkg", "Goa Beach Escape – 3D/2N", "₹7,499 per person", 1, "View Goa Plan", "Goa Package"),
+            ("manali_pkg", "Manali Snow Adventure – 5D/4N", "₹12,999 per person", 2, "View Manali Plan", "Manali Package"),
+        ]
+
+    def _answer(self, sql: str, params):
+        s = " ".join(sql.split()).lower()
+        if s.startswith("select 1"):
+            return [(1,)]
+        if "from uploaded_images where id = %s" in s and "content_type, sha256, created_at" in s:
+            img = self.images.get(params[0])
+            return [(img[1], img[2], img[3])] if img else []
+        if "from image_variants" in s:
+            return []
+        if "select storage, data from image_blobs" in s:
+            data = self.blobs.get(params[0])
+            return [("postgres", data)] if data is not None else []
+        if "max(updated_at), count(*) from featured_packages" in s:
+            return [(datetime(2025, 1, 1, tzinfo=timezone.utc), len(self.featured))]
+        if "from featured_packages p" in s:
+            return [f + (1280, 853) for f in self.featured]
+        if "select image_id from featured_packages" in s:
+            return [(f[3],) for f in self.featured]
+        if "from uploaded_images i left join image_blobs" in s:
+            after, limit = params[0], params[-1]
+            rows = []
+            for img_id in sorted(self.images):
+                if img_id > after:
+                    fn, ct, sha, created, w, h = self.images[img_id]
+                    rows.append((img_id, fn, ct, len(self.blobs[sha]), sha, w, h, created))
+                if len(rows) >= limit:
+                    break
+            return rows
+        raise NotImplementedError(f"FakeImageDB does not understand: {s[:120]}")
+
+    def connection(self):
+        db = self
+
+        class Cursor:
+            def __init__(self):
+                self._rows = []
+
+            def execute(self, sql, params=None):
+                with db.observe(sql):
+                    db.latency.sleep()
+                    self._rows = db._answer(sql, params or ())
+
+            def fetchone(self):
+                return self._rows[0] if self._rows else None
+
+            def fetchall(self):
+                return list(self._rows)
+
+            def close(self):
+                pass
+
+        class Connection:
+            closed = False
+
+            def cursor(self):
+                return Cursor()
+
+            def commit(self):
+                pass
+
+            def rollback(self):
+                pass
+
+        return Connection()
+
+    @contextmanager
+    def db_conn(self):
+        yield self.connection()
@@ -0,0 +1,379 @@
+"""
+Reproducible endpoint benchmark, no live Gemini / Google Sheets / Render Postgres.
+
+`run` starts FakeGeminiServer, boots gunicorn on bench/bench_app.py (app.py with
+fake Sheets and, unless --database-url is given, a fake image store), then drives
+each scenario at a fixed concurrency for a fixed time and reports throughput and
+p50/p95/p99. Results go to a JSON file; `compare` diffs two of them.
+
+Usage:
+    python bench/harness.py run --label baseline
+    python bench/harness.py run --label after --scenarios get_bookings image --concurrency 32
+    python bench/harness.py run --gemini-latency lognormal:1.5,0.6 --sheets-latency uniform:0.2,0.8
+    python bench/harness.py run --database-url postgresql://localhost/tripplanner_bench
+    python bench/harness.py compare bench/results/baseline-*.json bench/results/after-*.json
+
+Latency specs: "fixed:S", "uniform:LO,HI", "lognormal:MEDIAN,SIGMA" or "0" (see fakes.py).
+The same --seed gives the same sheet rows, images and request sequence.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from fakes import FakeGeminiServer, FakeSpreadsheet, bench_email
+from loadtest import _free_port, _pct
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, "..")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+# ===================== SCENARIOS =====================
+# Each scenario builds one request: (method, path, body bytes or None, headers).
+
+BENCH_ADMIN_TOKEN = "bench"
+
+def _json_body(obj):
+    return json.dumps(obj).encode(), {"Content-Type": "application/json"}
+
+
+def scenario_health(rng, ctx):
+    return "GET", "/", None, {}
+
+
+def scenario_trip_plan(rng, ctx):
+    start, travel = rng.sample(ctx["cities"], 2)
+    body, headers = _json_body({"mode": "TRIP_PLAN", "start_location": start, "travel_location": travel,
+                                "days": rng.randint(1, 7), "budget": f"{rng.randint(3, 20)}000"})
+    return "POST", "/trip-plan", body, headers
+
+
+def scenario_get_trip_plan(rng, ctx):
+    start, travel, days, budget = rng.choice(ctx["trip_plan_keys"])
+    body, headers = _json_body({"start_location": start, "travel_location": travel, "days": days, "budget": budget})
+    return "POST", "/get-trip-plan", body, headers
+
+
+def scenario_get_bookings(rng, ctx):
+    body, headers = _json_body({"email": bench_email(rng.randrange(ctx["customers"]))})
+    return "POST", "/get-bookings", body, headers
+
+
+def scenario_get_bookings_batch(rng, ctx):
+    emails = [bench_email(i) for i in rng.sample(range(ctx["customers"]), min(100, ctx["customers"]))]
+    body, headers = _json_body({"emails": emails})
+    return "POST", "/get-bookings/batch", body, dict(headers, **{"X-Admin-Token": BENCH_ADMIN_TOKEN})
+
+
+def scenario_generate_otp(rng, ctx):
+    body, headers = _json_body({"email": bench_email(rng.randrange(ctx["customers"]))})
+    return "POST", "/generate-otp", body, headers
+
+
+def scenario_image(rng, ctx):
+    return "GET", f"/image/{rng.choice(ctx['image_ids'])}", None, {}
+
+
+def scenario_image_revalidate(rng, ctx):
+    image_id = rng.choice(ctx["image_ids"])
+    return "GET", f"/image/{image_id}", None, {"If-None-Match": f'"{ctx["image_etags"][image_id]}"'}
+
+
+def scenario_list_images(rng, ctx):
+    return "GET", "/api/images?limit=20", None, {"X-Admin-Token": BENCH_ADMIN_TOKEN}
+
+
+def scenario_featured_packages(rng, ctx):
+    return "GET", "/featured-packages", None, {"Accept-Encoding": "gzip"}
+
+
+def scenario_dummy(rng, ctx):
+    body, headers = _json_body({"email": "a@b.com", "days": "3", "budget": "3000-6000"})
+    return "POST", "/dummy", body, headers
+
+
+SCENARIOS = {
+    "health": scenario_health,
+    "trip_plan": scenario_trip_plan,
+    "get_trip_plan": scenario_get_trip_plan,
+    "get_bookings": scenario_get_bookings,
+    "get_bookings_batch": scenario_get_bookings_batch,
+    "generate_otp": scenario_generate_otp,
+    "image": scenario_image,
+    "image_revalidate": scenario_image_revalidate,
+    "list_images": scenario_list_images,
+    "featured_packages": scenario_featured_packages,
+    "dummy": scenario_dummy,
+}
+
+
+# ===================== CLIENT =====================
+
+def _request(conn, method, path, body, headers):
+    conn.request(method, path, body=body, headers=headers)
+    resp = conn.getresponse()
+    data = resp.read()
+    return resp.status, resp.getheaders(), data
+
+
+def _wait_ready(port, proc, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("gunicorn exited during start-up")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            status, _, _ = _request(conn, "GET", "/ready", None, {})
+            conn.close()
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("gunicorn did not become ready")
+
+
+def drive(port, scenario, ctx, concurrency, duration, seed) -> dict:
+    """`concurrency` keep-alive clients issue requests back to back for `duration` seconds."""
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(n):
+        rng = random.Random(f"{seed}-{n}")
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        local_lat, local_status = [], {}
+        while time.perf_counter() < stop_at:
+            method, path, body, headers = scenario(rng, ctx)
+            start = time.perf_counter()
+            try:
+                status = _request(conn, method, path, body, headers)[0]
+            except (OSError, http.client.HTTPException):
+                status = 0
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+            local_lat.append(time.perf_counter() - start)
+            local_status[status] = local_status.get(status, 0) + 1
+        conn.close()
+        with lock:
+            latencies.extend(local_lat)
+            for k, v in local_status.items():
+                statuses[k] = statuses.get(k, 0) + v
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    ok = sum(v for k, v in statuses.items() if 200 <= k < 400)
+    return {
+        "requests": len(latencies),
+        "ok": ok,
+        "errors": len(latencies) - ok,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(_pct(latencies, 50) * 1000, 2),
+        "p95_ms": round(_pct(latencies, 95) * 1000, 2),
+        "p99_ms": round(_pct(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def _seed_images(port, count, size, seed):
+    """Real database only: upload `count` random images if the table is empty."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    rng = random.Random(seed)
+    for _ in range(count):
+        boundary = uuid.uuid4().hex
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"bench.jpg\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n"
+        ).encode() + rng.randbytes(size) + f"\r\n--{boundary}--\r\n".encode()
+        _request(conn, "POST", "/api/upload-image", body,
+                 {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    conn.close()
+
+
+def _image_context(port, args):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    admin = {"X-Admin-Token": BENCH_ADMIN_TOKEN}
+    listing = json.loads(_request(conn, "GET", "/api/images?limit=100", None, admin)[2] or b"{}")
+    if not listing.get("images") and args.database_url:
+        _seed_images(port, args.images, args.image_bytes, args.seed)
+        listing = json.loads(_request(conn, "GET", "/api/images?limit=100", None, admin)[2] or b"{}")
+    image_ids = [img["id"] for img in listing.get("images", [])]
+    etags = {}
+    for image_id in image_ids:
+        headers = dict(_request(conn, "GET", f"/image/{image_id}", None, {})[1])
+        etags[image_id] = (headers.get("ETag") or "").strip('"')
+    conn.close()
+    return image_ids, etags
+
+
+# ===================== RUN / COMPARE =====================
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def cmd_run(args):
+    sheets = {"trip_plan_rows": args.trip_plan_rows, "booking_rows": args.booking_rows,
+              "customers": args.customers, "latency": args.sheets_latency, "seed": args.seed}
+    images = {"images": args.images, "image_bytes": args.image_bytes, "latency": args.db_latency, "seed": args.seed}
+    # rebuilt here from the same seed, so requests can target rows that exist
+    spreadsheet = FakeSpreadsheet(**dict(sheets, latency="0"))
+
+    gemini = FakeGeminiServer(args.gemini_latency, args.gemini_error_rate, seed=args.seed).start()
+    port = _free_port()
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        GEMINI_API_BASE=gemini.base_url,
+        GEMINI_API_KEY="bench",
+        ADMIN_TOKEN=BENCH_ADMIN_TOKEN,
+        GUNICORN_WORKER_CLASS=args.worker_class,
+        WEB_CONCURRENCY=str(args.workers),
+        GUNICORN_THREADS=str(args.threads),
+        WARMUP_BLOCKING="1",
+        # no worker recycling mid-run: restarts show up as resets and warm-up spikes
+        GUNICORN_MAX_REQUESTS="0",
+        BENCH_FAKES=json.dumps({"sheets": sheets, "images": images, "real_db": bool(args.database_url)}),
+    )
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+    else:
+        env.pop("DATABASE_URL", None)
+        env["DB_MIGRATE_ON_START"] = "0"
+    env.update(kv.split("=", 1) for kv in args.env)
+
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--pythonpath", "bench", "bench_app:app", "--access-logfile", "/dev/null"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    results = {}
+    try:
+        _wait_ready(port, proc)
+        image_ids, etags = _image_context(port, args)
+        ctx = {
+            "cities": sorted({k[0] for k in spreadsheet.trip_plan_keys()}),
+            "trip_plan_keys": spreadsheet.trip_plan_keys(),
+            "customers": args.customers,
+            "image_ids": image_ids,
+            "image_etags": etags,
+        }
+        for name in args.scenarios:
+            if name.startswith("image") and not image_ids:
+                print(f"… {name}: skipped (no images)", file=sys.stderr)
+                continue
+            print(f"… {name}", file=sys.stderr)
+            if args.warmup:
+                drive(port, SCENARIOS[name], ctx, args.concurrency, args.warmup, f"{args.seed}-warmup")
+            results[name] = drive(port, SCENARIOS[name], ctx, args.concurrency, args.duration, args.seed)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        gemini.stop()
+
+    report = {
+        "label": args.label,
+        "git_rev": _git_rev(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("func", "output")},
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{args.label}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    cols = ["requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+    print(f"{'scenario':<18}" + "".join(f"{c:>16}" for c in cols))
+    for name, row in results.items():
+        print(f"{name:<18}" + "".join(f"{row[c]!s:>16}" for c in cols))
+    print(f"\nsaved {output}")
+
+
+def cmd_compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"before: {before['label']} @ {before.get('git_rev')}   after: {after['label']} @ {after.get('git_rev')}")
+    changed = [k for k in before["config"] if k != "label" and before["config"][k] != after["config"].get(k)]
+    if changed:
+        print("warning: runs used different settings: " + ", ".join(changed))
+
+    cols = ["throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+    print(f"{'scenario':<18}" + "".join(f"{c:>26}" for c in cols))
+    for name in before["results"]:
+        if name not in after["results"]:
+            continue
+        cells = []
+        for c in cols:
+            b, a = before["results"][name][c], after["results"][name][c]
+            delta = f"{(a - b) / b * 100:+.1f}%" if b else "n/a"
+            cells.append(f"{b:>9} → {a:<9} {delta:>6}")
+        print(f"{name:<18}" + "".join(f"{c:>26}" for c in cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="benchmark the endpoints against local fakes")
+    run.add_argument("--label", default="run")
+    run.add_argument("--output", help="result file (default bench/results/<label>-<time>.json)")
+    run.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    run.add_argument("--concurrency", type=int, default=16)
+    run.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    run.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before each scenario")
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--worker-class", default="gthread")
+    run.add_argument("--workers", type=int, default=2)
+    run.add_argument("--threads", type=int, default=16)
+    run.add_argument("--gemini-latency", default="lognormal:1.0,0.4")
+    run.add_argument("--gemini-error-rate", type=float, default=0.0)
+    run.add_argument("--sheets-latency", default="uniform:0.2,0.6", help="per Sheets API call")
+    run.add_argument("--trip-plan-rows", type=int, default=2000)
+    run.add_argument("--booking-rows", type=int, default=5000)
+    run.add_argument("--customers", type=int, default=1000)
+    run.add_argument("--database-url", help="use a real (local) Postgres instead of the in-memory image store")
+    run.add_argument("--db-latency", default="fixed:0.001", help="per query, fake image store only")
+    run.add_argument("--images", type=int, default=20)
+    run.add_argument("--image-bytes", type=int, default=200_000)
+    run.add_argument("--env", nargs="*", default=[], metavar="KEY=VALUE", help="extra settings for the app")
+    run.add_argument("--verbose", action="store_true", help="show gunicorn's stderr")
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser("compare", help="diff two result files")
+    compare.add_argument("before")
+    compare.add_argument("after")
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Load test: how the gunicorn worker classes cope with slow upstream calls.
+
+Starts a local fake Gemini endpoint that answers after --gemini-latency seconds,
+then, for each worker class, boots `gunicorn app:app` with gunicorn.conf.py
+against it and fires --concurrency simultaneous /trip-plan requests while
+probing the `/` health check. Nothing external is contacted.
+
+Usage:
+    python bench/loadtest.py
+    python bench/loadtest.py --worker-classes sync gthread gevent --concurrency 64 --gemini-latency 3
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_slow_gemini(latency: float):
+    """Minimal generateContent stand-in that sleeps `latency` seconds per call."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(latency)
+            body = json.dumps(
+                {"candidates": [{"content": {"parts": [{"text": "Day 1: Baga Beach, Fort Aguada"}]}}]}
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", _free_port()), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _get(url: str, timeout: float = 120):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return status, time.perf_counter() - start
+
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run_one(worker_class: str, gemini_base: str, args) -> dict:
+    port = _free_port()
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        GEMINI_API_BASE=gemini_base,
+        GEMINI_API_KEY="loadtest",
+        GUNICORN_WORKER_CLASS=worker_class,
+        WEB_CONCURRENCY=str(args.workers),
+        GUNICORN_THREADS=str(args.threads),
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "--access-logfile", "/dev/null"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 30
+        while _get(base + "/", timeout=1)[0] != 200:
+            if time.time() > deadline or proc.poll() is not None:
+                raise RuntimeError(f"gunicorn ({worker_class}) did not start")
+            time.sleep(0.2)
+
+        query = urllib.parse.urlencode(
+            {"mode": "TRIP_PLAN", "start_location": "Chennai", "travel_location": "Goa", "days": 3, "budget": 6000}
+        )
+        health = []
+        stop = threading.Event()
+
+        def probe_health():
+            while not stop.is_set():
+                health.append(_get(base + "/", timeout=120)[1])
+                time.sleep(0.05)
+
+        prober = threading.Thread(target=probe_health, daemon=True)
+        start = time.perf_counter()
+        prober.start()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda _: _get(f"{base}/trip-plan?{query}"), range(args.requests)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        prober.join()
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    latencies = [t for status, t in results if status == 200]
+    return {
+        "worker_class": worker_class,
+        "requests": args.requests,
+        "ok": len(latencies),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "trip_plan_p50_s": round(_pct(latencies, 50), 3),
+        "trip_plan_p95_s": round(_pct(latencies, 95), 3),
+        "health_p50_ms": round(_pct(health, 50) * 1000, 1),
+        "health_p95_ms": round(_pct(health, 95) * 1000, 1),
+        "health_max_ms": round(max(health) * 1000, 1) if health else 0.0,
+        "health_mean_ms": round(statistics.mean(health) * 1000, 1) if health else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--worker-classes", nargs="+", default=["sync", "gthread"])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--gemini-latency", type=float, default=2.0, help="seconds per fake Gemini call")
+    args = parser.parse_args(argv)
+
+    gemini = start_slow_gemini(args.gemini_latency)
+    gemini_base = f"http://127.0.0.1:{gemini.server_address[1]}/v1"
+
+    rows = []
+    for wc in args.worker_classes:
+        print(f"… {wc}", file=sys.stderr)
+        rows.append(run_one(wc, gemini_base, args))
+    gemini.shutdown()
+
+    cols = ["worker_class", "ok", "elapsed_s", "throughput_rps", "trip_plan_p50_s", "trip_plan_p95_s",
+            "health_p50_ms", "health_p95_ms", "health_max_ms"]
+    print("  ".join(f"{c:>15}" for c in cols))
+    for row in rows:
+        print("  ".join(f"{row[c]!s:>15}" for c in cols))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Micro-benchmark: per-request overhead of request decoding + JSON responses.
+
+Compares the old per-route pattern (is_json/form/args sniffing + json.dumps +
+Response) with the shared layer in app.py (get_request_data + json_response),
+and the stdlib vs orjson encoders on a /get-bookings sized payload.
+No network, Sheets or Postgres needed.
+
+Usage:
+    python bench/request_layer.py [--iterations 20000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app as app_module  # noqa: E402
+from flask import request, Response  # noqa: E402
+
+app = app_module.app
+
+
+# ---- the pattern every route used before the shared layer ----
+@app.route("/_bench/legacy-dummy", methods=["GET", "POST"])
+def _legacy_dummy():
+    data = {}
+    try:
+        if request.is_json:
+            data = request.get_json(silent=True) or {}
+        elif request.form:
+            data = request.form.to_dict()
+        elif request.args:
+            data = request.args.to_dict()
+    except Exception:
+        pass
+    return Response(
+        json.dumps({"status": "success", "message": "Dummy API called successfully!", "received": data}),
+        mimetype="application/json",
+        status=200,
+    )
+
+
+def _time_requests(client, path, iterations, **kwargs):
+    # warm-up
+    for _ in range(200):
+        client.open(path, **kwargs)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        client.open(path, **kwargs)
+    return (time.perf_counter() - start) / iterations * 1e6  # µs per request
+
+
+def _time_encoder(encoder_name, payload, iterations):
+    app_module.JSON_ENCODER = encoder_name
+    start = time.perf_counter()
+    for _ in range(iterations):
+        app_module.dumps_json(payload)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args(argv)
+    n = args.iterations
+
+    client = app.test_client()
+    inputs = {
+        "json": dict(method="POST", json={"email": "a@b.com", "days": "3", "budget": "3000-6000"}),
+        "form": dict(method="POST", data={"email": "a@b.com", "days": "3", "budget": "3000-6000"}),
+        "args": dict(method="GET", query_string={"email": "a@b.com", "days": "3", "budget": "3000-6000"}),
+    }
+
+    print(f"request round trip through the Flask test client ({n} iterations, µs/request)")
+    print(f"{'input':<6} {'before':>10} {'after':>10} {'delta':>8}")
+    for name, kwargs in inputs.items():
+        before = _time_requests(client, "/_bench/legacy-dummy", n, **kwargs)
+        after = _time_requests(client, "/dummy", n, **kwargs)
+        print(f"{name:<6} {before:>10.1f} {after:>10.1f} {(after - before) / before * 100:>+7.1f}%")
+
+    bookings = {
+        "bookings": [
+            {
+                "package": "Goa Beach Escape – 3D/2N",
+                "booking_id": f"A2M-G-20251130{i:06d}",
+                "place": "Goa",
+                "travel_date": "2025-12-24",
+                "members": "4",
+                "timestamp": "2025-11-30 15:46:12",
+            }
+            for i in range(200)
+        ]
+    }
+    print(f"\nJSON encoding of a 200-booking payload ({n} iterations, µs/encode)")
+    for enc in sorted(app_module._json_encoders):
+        print(f"{enc:<8} {_time_encoder(enc, bookings, n):>10.1f}")
+    if "orjson" not in app_module._json_encoders:
+        print("(orjson not installed – pip install orjson to compare)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Startup-time benchmark: how long `import app` and the first request take.
+
+Each run is a fresh interpreter (like a gunicorn worker boot / Render cold start).
+Also lists which heavy dependencies were already imported by then – with lazy
+imports none of them should be loaded just to answer `/`.
+
+Usage:
+    python bench/startup.py [--runs 10] [--path /]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+HEAVY_MODULES = ["requests", "gspread", "google.oauth2.service_account", "psycopg2", "PIL.Image"]
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+client = app.app.test_client()
+status = client.get(sys.argv[1]).status_code
+t2 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "first_request_ms": (t2 - t1) * 1000,
+    "status": status,
+    "loaded": [m for m in sys.argv[2:] if m in sys.modules],
+}))
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--path", default="/", help="route used for the first request")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE, args.path, *HEAVY_MODULES],
+            cwd=ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    imports = [r["import_ms"] for r in runs]
+    firsts = [r["first_request_ms"] for r in runs]
+    print(f"runs: {args.runs}   first request: GET {args.path} → {runs[-1]['status']}")
+    print(f"import app        median {statistics.median(imports):8.1f} ms   min {min(imports):8.1f} ms")
+    print(f"first request     median {statistics.median(firsts):8.1f} ms   min {min(firsts):8.1f} ms")
+    print(f"heavy modules loaded after first request: {', '.join(runs[-1]['loaded']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
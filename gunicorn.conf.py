@@ -0,0 +1,96 @@
+"""
+Gunicorn settings for the Trip Planner API.
+
+Start with:  gunicorn app:app        (this file is picked up automatically from the cwd)
+
+Almost all request time is spent waiting on Gemini (up to 30 s), Google Sheets
+and Postgres, so each worker runs many requests concurrently instead of one:
+
+  GUNICORN_WORKER_CLASS=gthread  (default) – a thread pool per worker. Works with
+                                  psycopg2 / gspread / requests as they are.
+  GUNICORN_WORKER_CLASS=gevent   – cooperative greenlets, for very high fan-out.
+                                  Needs `pip install gevent psycogreen`; psycopg2 is
+                                  made gevent-friendly in post_fork below.
+  GUNICORN_WORKER_CLASS=sync     – the old one-request-per-worker behaviour.
+"""
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+
+# gthread: request threads per worker (app.py sizes its DB pool from this too).
+# Kept at 1 for "sync" – gunicorn silently turns sync + threads>1 into gthread.
+threads = int(os.environ.get("GUNICORN_THREADS", 16)) if worker_class == "gthread" else 1
+# gevent: concurrent greenlets per worker
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 200))
+
+# Gemini call (30 s) + model discovery + retry must fit inside one request
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 90))
+graceful_timeout = 30
+keepalive = 5
+
+# recycle workers now and then (jitter so they don't all restart together)
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+accesslog = "-"
+errorlog = "-"
+
+
+# With several workers, prometheus_client keeps per-process metric files here and /metrics
+# aggregates them (set by the master so every forked worker inherits it).
+if workers > 1 and not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(tempfile.gettempdir(), "tripplanner-prometheus")
+
+# Run schema setup / migrations once per deploy in the master, before any worker boots.
+# Set DB_MIGRATE_ON_START=0 when `flask --app app init-db` runs as a separate deploy step.
+migrate_on_start = os.environ.get("DB_MIGRATE_ON_START", "1").lower() not in ("0", "false", "no")
+
+
+def on_starting(server):
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        # start every deploy with empty counters
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+    if migrate_on_start:
+        # separate process, so the master never imports app (and its locks / clients)
+        # before workers fork and, for gevent, monkey-patch
+        subprocess.run([sys.executable, "-m", "flask", "--app", "app", "init-db"], check=False)
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        # psycopg2 blocks in C code; route its waits through gevent so one slow
+        # query doesn't stall every greenlet in the worker.
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
+        server.log.info("worker %s: psycopg2 patched for gevent", worker.pid)
+
+
+def post_worker_init(worker):
+    # Runs in the worker after the app is loaded, before it accepts connections:
+    # connect to Postgres / Gemini / Sheets and prime caches so the first requests
+    # after a deploy or max_requests recycle don't pay for it. See app.warm_up().
+    from app import start_warm_up
+
+    start_warm_up()
+    worker.log.info("worker %s: warm-up done", worker.pid)
+
+
+def child_exit(server, worker):
+    # same as prometheus_client.multiprocess.mark_process_dead(): drop the dead worker's
+    # live gauges (in-flight counts) without importing prometheus_client in the master
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        for path in glob.glob(os.path.join(metrics_dir, f"gauge_live*_{worker.pid}.db")):
+            os.remove(path)
@@ -0,0 +1,126 @@
+"""
+Move image blobs between storage backends (postgres <-> filesystem) online.
+
+Usage:
+    python migrate_image_storage.py --to filesystem
+    python migrate_image_storage.py --to postgres --batch-size 20
+
+Each blob is copied to the target backend and its image_blobs row is switched
+over in its own short transaction, so /image/<id> keeps serving throughout:
+readers see either the old location or the new one, never a half-moved blob.
+Source files are only deleted --grace seconds after their row switched, so a
+request that read storage='filesystem' just before the switch can still open them.
+Safe to stop and re-run; already-moved blobs are skipped.
+"""
+import argparse
+import sys
+import time
+
+from app import get_db_conn, get_blob_store, blob_stores
+
+
+def _remove_expired(pending: list, grace: float, now: float = None):
+    """Remove sources switched over at least `grace` seconds ago; pending is [(switched_at, store, sha256)]."""
+    now = time.time() if now is None else now
+    while pending and now - pending[0][0] >= grace:
+        _, store, sha256 = pending.pop(0)
+        store.remove(sha256)
+
+
+def migrate(target_name: str, batch_size: int = 50, sleep: float = 0.0, keep_source: bool = False,
+            grace: float = 30.0) -> int:
+    target = get_blob_store(target_name)
+    moved = 0
+    last_sha = ""
+    pending = []  # sources waiting out the grace period before removal
+
+    conn = get_db_conn()
+    try:
+        while True:
+            cur = conn.cursor()
+            # keyset pagination over the hash – no OFFSET scans, stable across re-runs
+            cur.execute(
+                """
+                SELECT sha256, storage
+                FROM image_blobs
+                WHERE storage <> %s AND sha256 > %s
+                ORDER BY sha256
+                LIMIT %s;
+                """,
+                (target.name, last_sha, batch_size),
+            )
+            batch = cur.fetchall()
+            conn.commit()
+            if not batch:
+                break
+
+            for sha256, source_name in batch:
+                last_sha = sha256
+                source = get_blob_store(source_name)
+
+                # lock just this row while switching it over
+                cur.execute(
+                    "SELECT storage FROM image_blobs WHERE sha256 = %s FOR UPDATE;",
+                    (sha256,),
+                )
+                row = cur.fetchone()
+                if not row or row[0] != source_name:
+                    conn.rollback()  # moved by someone else meanwhile
+                    continue
+
+                data = source.read(cur, sha256)
+                if data is None:
+                    conn.rollback()
+                    print(f"!! {sha256}: no bytes found in {source_name}, skipped", file=sys.stderr)
+                    continue
+
+                target.write(cur, sha256, data)
+                conn.commit()
+                moved += 1
+
+                if not keep_source:
+                    pending.append((time.time(), source, sha256))
+
+            cur.close()
+            _remove_expired(pending, grace)
+            print(f"moved {moved} blob(s) so far (last {last_sha[:12]}…)")
+            if sleep:
+                time.sleep(sleep)  # throttle to keep load low on a live database
+    finally:
+        conn.close()
+
+    if pending:
+        wait = grace - (time.time() - pending[-1][0])
+        if wait > 0:
+            print(f"waiting {wait:.0f}s before deleting the last {len(pending)} source file(s)")
+            time.sleep(wait)
+        _remove_expired(pending, grace)
+
+    return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--to", required=True, choices=sorted(blob_stores), help="target storage backend")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--sleep", type=float, default=0.0, help="seconds to pause between batches")
+    parser.add_argument(
+        "--keep-source",
+        action="store_true",
+        help="don't delete files from the filesystem store after moving them to postgres",
+    )
+    parser.add_argument(
+        "--grace",
+        type=float,
+        default=30.0,
+        help="seconds to keep a moved source file for requests that already looked up its old location",
+    )
+    args = parser.parse_args(argv)
+
+    moved = migrate(args.to, batch_size=args.batch_size, sleep=args.sleep, keep_source=args.keep_source,
+                    grace=args.grace)
+    print(f"✅ done – {moved} blob(s) moved to {args.to}")
+
+
+if __name__ == "__main__":
+    main()